@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+NUMBER = r"(-?\d+(?:\.\d+)?)"
+
+# "70-110", "3.5 – 5.0 g/dL", "<200", "<= 5.6", ">40", "≥ 60"
+RANGE_RE = rf"^\s*{NUMBER}\s*[-–—]\s*{NUMBER}"
+UPPER_RE = rf"^\s*(?:<=?|≤)\s*{NUMBER}"
+LOWER_RE = rf"^\s*(?:>=?|≥)\s*{NUMBER}"
+
+
+# ── Reference range parsing (vectorized) ────────────────────────────
+def parse_ref_range(ref_range):
+    text = ref_range.fillna("").astype(str)
+    both = text.str.extract(RANGE_RE).astype(float)
+    upper = text.str.extract(UPPER_RE)[0].astype(float)
+    lower = text.str.extract(LOWER_RE)[0].astype(float)
+    low = both[0].fillna(lower)
+    high = both[1].fillna(upper)
+    return low, high
+
+
+def normalize_flag(flag):
+    text = flag.fillna("").astype(str).str.strip().str.lower()
+    return pd.Series(
+        np.select(
+            [text.str.startswith("h"), text.str.startswith("l"),
+             text.str.startswith(("a", "c", "*"))],
+            ["High", "Low", "Abnormal"],
+            "",
+        ),
+        index=flag.index,
+    )
+
+
+# ── Out-of-range detection for all rows at once ─────────────────────
+# Adds low/high bounds, the computed status and an `abnormal` column;
+# rows whose range can't be parsed fall back to the recorded flag, and a
+# recorded flag wins over a computed "Normal" (the lab saw something).
+def detect(df):
+    df = df.copy()
+    df["low"], df["high"] = parse_ref_range(df["ref_range"])
+    value = pd.to_numeric(df["result"], errors="coerce")
+
+    computed = np.select(
+        [value < df["low"], value > df["high"]],
+        ["Low", "High"],
+        "Normal",
+    )
+    has_range = df["low"].notna() | df["high"].notna()
+    flagged = normalize_flag(df["flag"])
+
+    status = np.where(has_range & value.notna(), computed, flagged.replace("", "Unknown"))
+    df["status"] = np.where((status == "Normal") & flagged.ne(""), flagged, status)
+    df["abnormal"] = df["status"].isin(["High", "Low", "Abnormal"])
+    return df
+
+
+# ── Compact per-test summary ────────────────────────────────────────
+def summarize(df):
+    if df.empty:
+        return pd.DataFrame()
+    df = df.sort_values("timestamp")
+    value = pd.to_numeric(df["result"], errors="coerce")
+    grouped = df.assign(value=value).groupby("test_name", sort=True)
+    summary = grouped.agg(
+        unit=("unit", "last"),
+        ref_range=("ref_range", "last"),
+        results=("value", "size"),
+        abnormal=("abnormal", "sum"),
+        high=("status", lambda s: int((s == "High").sum())),
+        low=("status", lambda s: int((s == "Low").sum())),
+        min=("value", "min"),
+        max=("value", "max"),
+        latest=("value", "last"),
+        latest_status=("status", "last"),
+        latest_date=("timestamp", "last"),
+    )
+    return summary.reset_index()
+
+
+def _num(value):
+    return "-" if pd.isna(value) else f"{value:g}"
+
+
+def summary_text(summary):
+    if summary.empty:
+        return "No results."
+    lines = ["Per-test summary (status from the reference range, or the recorded flag):"]
+    for s in summary.itertuples(index=False):
+        lines.append(
+            f"{s.test_name} ({s.unit or '-'}, ref {s.ref_range or '-'}): {s.results} results, "
+            f"{int(s.abnormal)} abnormal ({s.high} High, {s.low} Low), range {_num(s.min)}–{_num(s.max)}, "
+            f"latest {_num(s.latest)} {s.latest_status} on {str(s.latest_date)[:10]}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+ANSWER_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".answer_cache.sqlite")
+ANSWER_CACHE_MAX_ENTRIES = 5000
+
+
+def _sha(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ── Persistent RAG answer cache ─────────────────────────────────────
+# Keyed by model, prompt template, the retrieved rows (id + text hash, so
+# an edited row changes the key) and the question. answer_reports maps
+# each answer to its rows so an edit/delete can drop exactly those answers.
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS answer_reports (
+                key TEXT NOT NULL,
+                report_id INTEGER NOT NULL,
+                PRIMARY KEY (key, report_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_answer_reports_report ON answer_reports (report_id);
+            CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used);
+            """
+        )
+
+    @staticmethod
+    def key(model, prompt_template, docs, query):
+        return _sha(json.dumps({
+            "model": model,
+            "prompt": _sha(prompt_template),
+            "docs": [[d.metadata.get("id"), _sha(d.page_content)] for d in docs],
+            "query": query,
+        }))
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, answer, report_ids):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO answer_reports (key, report_id) VALUES (?, ?)",
+                [(key, int(i)) for i in report_ids if i is not None],
+            )
+            self._evict()
+            self._db.commit()
+
+    def _delete(self, keys):
+        self._db.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+        self._db.executemany("DELETE FROM answer_reports WHERE key = ?", [(k,) for k in keys])
+
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            keys = [r[0] for r in self._db.execute(
+                "SELECT key FROM answers ORDER BY last_used LIMIT ?", (count - self.max_entries,)
+            )]
+            self._delete(keys)
+
+    # Called when blood_reports rows are edited or deleted
+    def invalidate_reports(self, report_ids):
+        ids = [int(i) for i in report_ids]
+        if not ids:
+            return 0
+        with self._lock:
+            placeholders = ", ".join("?" * len(ids))
+            keys = [r[0] for r in self._db.execute(
+                f"SELECT DISTINCT key FROM answer_reports WHERE report_id IN ({placeholders})", ids
+            )]
+            self._delete(keys)
+            self._db.commit()
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache()
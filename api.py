@@ -0,0 +1,244 @@
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+import uvicorn
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+import bulk_import
+import db
+import export
+import records
+import reports
+from answer_cache import get_answer_cache
+from async_core import load_rag_resources, run_sync
+from context_builder import doc_report_ids
+from jobs import EMBEDDING_LOCK, get_job_queue, run_rag_analysis
+from models import warm_up
+from patient_search import NAME_MATCH_LIMIT, search_patients
+from rag import ANALYSIS_QUERY, SYSTEM_PROMPT, abnormal_context, build_answer_chain, model_id, stream_answer
+from tracing import latency_summary, prometheus_text
+from vector_index import get_report_index
+
+# Plain `def` endpoints run on FastAPI's thread pool, so requests share one
+# process-wide connection pool, model cache and vector index instead of
+# re-running a Streamlit script per session. Run a single worker process
+# (the caches are per process):  uvicorn api:app --host 0.0.0.0 --port 8000
+@asynccontextmanager
+async def lifespan(app):
+    warm_up()
+    yield
+
+
+app = FastAPI(title="Blood Reports API", lifespan=lifespan)
+
+NDJSON = "application/x-ndjson"
+STREAM_BATCH_SIZE = 1000
+
+
+class Record(BaseModel):
+    name: str
+    test_name: str
+    result: float
+    unit: str = ""
+    ref_range: str = ""
+    flag: str = ""
+    timestamp: str | None = None  # ISO or HL7 (YYYYMMDD[HHMM[SS]]); defaults to now
+
+
+class AnalysisRequest(BaseModel):
+    name: str | None = None
+    start: date | None = None
+    end: date | None = None  # inclusive
+    test_name: str | None = None
+    flag: str | None = None
+    query: str = ANALYSIS_QUERY
+
+
+def ndjson(items):
+    for item in items:
+        yield json.dumps(item, default=str) + "\n"
+
+
+def sync_index():
+    with EMBEDDING_LOCK:
+        get_report_index().sync()
+
+
+def analysis_filters(request):
+    filters = {"name": request.name, "test_name": request.test_name, "flag": request.flag}
+    if request.start:
+        filters["start"] = request.start
+    if request.end:
+        filters["end"] = request.end + timedelta(days=1)
+    return {k: v for k, v in filters.items() if v}
+
+
+@app.get("/health")
+def health():
+    return {
+        "pool": db.get_pool().stats(),
+        "query_cache": db.get_query_cache().stats(),
+        "latency": latency_summary(),
+    }
+
+
+# Stage latency histograms, when prometheus_client is installed
+@app.get("/metrics")
+def metrics():
+    text = prometheus_text()
+    if text is None:
+        raise HTTPException(404, "prometheus_client is not installed")
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+
+# ── Records ─────────────────────────────────────────────────────────
+# New rows are embedded into the vector index after the response is sent
+@app.post("/records", status_code=201)
+def insert_record(record: Record, background: BackgroundTasks):
+    try:
+        row = bulk_import.validate(record.model_dump())
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    records.insert_reports([row])
+    background.add_task(sync_index)
+    return {"inserted": 1}
+
+
+@app.post("/records/bulk")
+def insert_records(rows: list[Record], background: BackgroundTasks):
+    stats = bulk_import.ImportStats()
+    items = ({**r.model_dump(), "_line": i} for i, r in enumerate(rows, start=1))
+    bulk_import.load_rows(bulk_import.valid_rows(items, stats, "request"), stats)
+    if stats.loaded:
+        background.add_task(sync_index)
+    return {
+        "loaded": stats.loaded,
+        "rejected": stats.rejected,
+        "errors": stats.errors,
+        "rows_per_sec": round(stats.rows_per_sec, 1),
+    }
+
+
+@app.get("/records/search")
+def search_records(name: str, start: date, end: date):
+    return {"rows": records.search_reports(name.strip(), start, end + timedelta(days=1))}
+
+
+# Ranked patient names for a partial, misspelled or sound-alike query
+@app.get("/patients/search")
+def find_patients(q: str, limit: int = Query(NAME_MATCH_LIMIT, ge=1, le=100)):
+    return {"patients": [{"name": n, "score": s, "match": how} for n, s, how in search_patients(q, limit)]}
+
+
+# Keyset pages: pass the returned `next` cursor back as after_ts / after_id
+@app.get("/records")
+def list_records(page_size: int = Query(50, ge=1, le=max(reports.PAGE_SIZES)),
+                 after_ts: datetime | None = None, after_id: int | None = None):
+    after = (after_ts, after_id) if after_ts is not None and after_id is not None else None
+    rows, next_cursor = reports.fetch_page(page_size, after)
+    return {
+        "rows": rows,
+        "next": {"after_ts": next_cursor[0], "after_id": next_cursor[1]} if next_cursor else None,
+    }
+
+
+# Every record as newline-delimited JSON, read with an unbuffered cursor
+@app.get("/records/stream")
+def stream_records():
+    rows = (
+        row
+        for batch in db.iter_query("SELECT * FROM blood_reports ORDER BY timestamp DESC, id DESC",
+                                   batch_size=STREAM_BATCH_SIZE)
+        for row in batch
+    )
+    return StreamingResponse(ndjson(rows), media_type=NDJSON)
+
+
+# Every record as a CSV/Parquet file: spooled from an unbuffered cursor,
+# then sent in chunks, so neither step holds the whole export in memory
+@app.get("/records/export")
+def export_records(fmt: str = "CSV"):
+    if fmt not in export.FORMATS:
+        raise HTTPException(400, f"fmt must be one of {list(export.FORMATS)}")
+    mime, ext = export.FORMATS[fmt]
+    return StreamingResponse(
+        export.iter_file(export.export_query(export.ALL_RECORDS_SQL, fmt=fmt)),
+        media_type=mime,
+        headers={"Content-Disposition": f'attachment; filename="blood_reports_all{ext}"'},
+    )
+
+
+# ── RAG analysis ────────────────────────────────────────────────────
+# NDJSON events: one "context" line, "token" lines as the answer is
+# generated (a single one on an answer-cache hit), then "done".
+def analysis_events(request):
+    index, tokenizer, llm = run_sync(load_rag_resources())
+    filters = analysis_filters(request)
+    with EMBEDDING_LOCK:
+        index.sync()
+        found = index.count(filters)
+        if found:
+            docs, counts, packing = abnormal_context(index, filters, request.query, tokenizer=tokenizer)
+    if not found:
+        yield {"event": "done", "cached": False, "error": "no records match the filters"}
+        return
+    yield {
+        "event": "context",
+        "rows": counts["rows"],
+        "abnormal": counts["abnormal"],
+        "packing": packing,
+    }
+
+    answer_cache = get_answer_cache()
+    cache_key = answer_cache.key(model_id(llm), SYSTEM_PROMPT, docs, request.query)
+    answer = answer_cache.get(cache_key)
+    if answer is not None:
+        yield {"event": "token", "text": answer}
+        yield {"event": "done", "cached": True}
+        return
+
+    timings, tokens = {}, []
+    for token in stream_answer(build_answer_chain(llm), request.query, docs, timings):
+        tokens.append(token)
+        yield {"event": "token", "text": token}
+    answer_cache.put(cache_key, "".join(tokens), doc_report_ids(docs))
+    yield {"event": "done", "cached": False, **timings}
+
+
+@app.post("/analysis")
+def analyze(request: AnalysisRequest, stream: bool = True):
+    if stream:
+        return StreamingResponse(ndjson(analysis_events(request)), media_type=NDJSON)
+    filters = analysis_filters(request)
+    index = get_report_index()
+    # Catch up first, so records just posted count towards the filters
+    with EMBEDDING_LOCK:
+        index.sync()
+        found = index.count(filters)
+    if not found:
+        raise HTTPException(404, "no records match the filters")
+    return run_rag_analysis(filters, request.query)
+
+
+# Long analyses can go through the job queue instead and be polled
+@app.post("/analysis/jobs", status_code=202)
+def submit_analysis(request: AnalysisRequest):
+    job_id = get_job_queue().submit(
+        "rag_analysis", {"filters": analysis_filters(request), "query": request.query}, label="api"
+    )
+    return {"id": job_id, "status": "queued"}
+
+
+@app.get("/analysis/jobs/{job_id}")
+def analysis_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(404, "unknown job")
+    return job
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
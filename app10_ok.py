@@ -1,52 +1,28 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from datetime import datetime, timedelta
 import pandas as pd
-from io import StringIO
 
-# ── LangChain imports ───────────────────────────────────────────────
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+import export
+import reports
+from answer_cache import get_answer_cache
+from context_builder import doc_report_ids
+from jobs import EMBEDDING_LOCK
+from models import get_llm, get_tokenizer, model_metrics, warm_up
+from rag import ANALYSIS_QUERY, SYSTEM_PROMPT, abnormal_context, build_answer_chain, model_id, stream_answer
+from records import insert_reports, search_reports
+from tracing import latency_summary, trace
+from vector_index import get_report_index
 
 st.set_page_config(page_title="Blood Reports Manager + RAG", layout="wide")
 
 st.title("Blood Reports Database Manager + RAG Analysis")
 
-# ── TiDB Config ─────────────────────────────────────────────────────
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
-
-# Write SSL certificate to temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
-    db_config["ssl_verify_cert"] = True
-
-# ── Helper function to run SQL queries ──────────────────────────────
-def run_query(query, params=None, fetch=False):
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        result = cursor.fetchall() if fetch else None
-        conn.commit()
-    except Exception as e:
-        st.error(f"Database error: {e}")
-        result = None
-    finally:
-        cursor.close()
-        conn.close()
-    return result
+# Load embedding model, tokenizer and Groq client in the background (once per process)
+warm_up()
+with st.sidebar.expander("⚙️ Model cache"):
+    st.json(model_metrics())
+with st.sidebar.expander("⏱️ Latency (this server process)"):
+    st.dataframe(latency_summary(), use_container_width=True)
 
 # ── Insert Record Form ──────────────────────────────────────────────
 st.header("➕ Insert Record")
@@ -64,15 +40,19 @@ with st.form("insert_form"):
     submitted = st.form_submit_button("Insert Record")
     if submitted:
         if name and test_name:
-            run_query(
-                """
-                INSERT INTO blood_reports 
-                (name, test_name, result, unit, ref_range, flag, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (name.strip(), test_name, result, unit, ref_range, flag, datetime.now()),
-            )
-            st.success("✅ Record inserted successfully!")
+            try:
+                insert_reports([(name.strip(), test_name, result, unit, ref_range, flag, datetime.now())])
+            except Exception as e:
+                st.error(f"Database error: {e}")
+            else:
+                st.success("✅ Record inserted successfully!")
+
+                # Pick up the new row in the persistent vector index
+                try:
+                    with EMBEDDING_LOCK:
+                        get_report_index().sync()
+                except Exception as e:
+                    st.warning(f"Record saved, but the vector index was not updated: {e}")
         else:
             st.warning("Please fill at least Patient Name and Test Name.")
 
@@ -95,21 +75,18 @@ if st.button("Search"):
     if search_name and start_date and end_date:
         end_date_inclusive = end_date + timedelta(days=1)
 
-        rows = run_query(
-            """
-            SELECT * FROM blood_reports 
-            WHERE name = %s 
-            AND timestamp >= %s 
-            AND timestamp < %s
-            ORDER BY timestamp DESC
-            """,
-            (search_name.strip(), start_date, end_date_inclusive),
-            fetch=True,
-        )
+        try:
+            rows = search_reports(search_name.strip(), start_date, end_date_inclusive)
+        except Exception as e:
+            st.error(f"Database error: {e}")
+            rows = None
         
         if rows:
             st.session_state.last_search_rows = rows
             st.session_state.last_search_name = search_name.strip()
+            st.session_state.last_search_filters = {
+                "name": search_name.strip(), "start": start_date, "end": end_date_inclusive,
+            }
             st.dataframe(rows)
             st.success(f"Found {len(rows)} record(s) for exact name: {search_name.strip()}")
         else:
@@ -130,105 +107,163 @@ if st.button("Search"):
             key="download_searched"
         )
 
-# ── Show All Records ────────────────────────────────────────────────
+# ── Show All Records (paginated) ────────────────────────────────────
 st.header("📋 All Records")
-if st.button("Show All Records"):
-    rows = run_query("SELECT * FROM blood_reports ORDER BY timestamp DESC", fetch=True)
-    if rows:
-        df_all = pd.DataFrame(rows)
-        st.dataframe(df_all)
-
-        # Download button for all records
-        csv_all = df_all.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Download All Records (CSV)",
-            data=csv_all,
-            file_name="blood_reports_all.csv",
-            mime="text/csv",
-            key="download_all"
-        )
+
+# Page-start cursors for the pages visited so far; None until first click
+if "all_page_cursors" not in st.session_state:
+    st.session_state.all_page_cursors = None
+    st.session_state.all_page_rows = []
+    st.session_state.all_next_cursor = None
+
+# Button callbacks run before the rerun, so Previous/Next render from the
+# page they just loaded
+def load_all_page(cursors):
+    st.session_state.all_page_error = None
+    try:
+        rows, next_cursor = reports.fetch_page(st.session_state.all_page_size, after=cursors[-1])
+    except Exception as e:
+        st.session_state.all_page_error = f"Database error: {e}"
+        return
+    st.session_state.all_page_cursors = cursors
+    st.session_state.all_page_rows = rows
+    st.session_state.all_next_cursor = next_cursor
+
+def previous_page():
+    cursors = st.session_state.all_page_cursors
+    if cursors and len(cursors) > 1:
+        load_all_page(cursors[:-1])
+
+def next_page():
+    if st.session_state.all_next_cursor is not None:
+        load_all_page(st.session_state.all_page_cursors + [st.session_state.all_next_cursor])
+
+col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+with col1:
+    st.selectbox("Rows per page", reports.PAGE_SIZES, index=1, key="all_page_size")
+with col2:
+    st.button("Show All Records", on_click=load_all_page, args=([None],))
+with col3:
+    cursors = st.session_state.all_page_cursors
+    st.button("◀ Previous", disabled=not cursors or len(cursors) < 2, on_click=previous_page)
+with col4:
+    st.button("Next ▶", disabled=st.session_state.all_next_cursor is None, on_click=next_page)
+if st.session_state.get("all_page_error"):
+    st.error(st.session_state.all_page_error)
+
+if st.session_state.all_page_cursors is not None:
+    if st.session_state.all_page_rows:
+        st.dataframe(pd.DataFrame(st.session_state.all_page_rows))
+        st.caption(f"Page {len(st.session_state.all_page_cursors)}")
+
+        # Full export streams from a server-side cursor into a spooled temp file;
+        # the page download is capped, larger exports go through the API
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            export_format = st.selectbox("Export format", list(export.FORMATS), key="export_format")
+        mime, ext = export.FORMATS[export_format]
+        try:
+            total = export.record_count()
+        except Exception as e:
+            st.error(f"Database error: {e}")
+        else:
+            if total > export.PAGE_EXPORT_MAX_ROWS:
+                st.info(
+                    f"{total:,} records are too many for an in-page download. Stream them from "
+                    f"the API instead: `GET /records/export?fmt={export_format}` (`uvicorn api:app`)."
+                )
+            elif st.button("Prepare export of all records"):
+                with st.spinner("Exporting..."):
+                    data = export.export_bytes(export.ALL_RECORDS_SQL, fmt=export_format)
+                st.download_button(
+                    label=f"📥 Download All Records ({export_format})",
+                    data=data,
+                    file_name=f"blood_reports_all{ext}",
+                    mime=mime,
+                    key="download_all"
+                )
     else:
         st.info("No records in the database yet.")
 
 # ── RAG Analysis ────────────────────────────────────────────────────
 st.header("🧠 RAG: Abnormal Reports & Recommendations")
 
+# Optional narrowing on top of the last search (applied as index pre-filters)
+col1, col2 = st.columns(2)
+with col1:
+    rag_test_name = st.text_input("Only test (optional)", key="rag_test_name")
+with col2:
+    rag_flag = st.selectbox("Only flag", ["Any", "High", "Low", "Normal"], key="rag_flag")
+
 if st.button("Run RAG Analysis (may take 10–30s first time)"):
-    with st.spinner("Preparing records + building vector store + analyzing..."):
-        
-        # Decide which records to analyze
+    with st.spinner("Updating vector index + retrieving + analyzing..."), trace("rag.analysis") as rag_trace:
+        # Persistent index, caught up with any rows added since the last sync.
+        # The embedding model and index are shared with queued jobs (jobs.py)
+        try:
+            index = get_report_index()
+            with EMBEDDING_LOCK:
+                index.sync()
+        except Exception as e:
+            st.error(f"Could not update the vector index: {e}")
+            index = None
+
+        # Decide which records to analyze – structured filters select the
+        # candidate rows inside the one shared index (no per-filter index)
         if st.session_state.get("last_search_rows") is not None and st.session_state.last_search_rows:
-            rows = st.session_state.last_search_rows
+            filters = dict(st.session_state.last_search_filters)
             source_info = f"filtered search results for exact name '{st.session_state.last_search_name}'"
         else:
-            rows = run_query("SELECT * FROM blood_reports", fetch=True)
+            filters = {}
             source_info = "ALL records in database (no search filter applied yet)"
-
-        if not rows:
+        if rag_test_name.strip():
+            filters["test_name"] = rag_test_name.strip()
+            source_info += f", test '{rag_test_name.strip()}'"
+        if rag_flag != "Any":
+            filters["flag"] = rag_flag
+            source_info += f", flag '{rag_flag}'"
+
+        record_count = index.count(filters) if index is not None else None
+        if record_count == 0:
             st.warning("No records available to analyze. Please insert or search for records first.")
-        else:
-            st.info(f"Analyzing {len(rows)} record(s) from: {source_info}")
-
-            # Prepare document texts
-            texts = []
-            for r in rows:
-                texts.append(
-                    f"Patient: {r['name']} | Test: {r['test_name']} | "
-                    f"Result: {r['result']} {r['unit']} | Ref Range: {r['ref_range']} | "
-                    f"Flag: {r['flag']} | Date: {r.get('timestamp', 'N/A')}"
-                )
-
-            # Embeddings
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={"device": "cpu"},
-                encode_kwargs={"normalize_embeddings": True},
-            )
-
-            vectorstore = FAISS.from_texts(texts, embeddings)
-            retriever = vectorstore.as_retriever(search_kwargs={"k": min(5, len(texts))})
-
-            # LLM
-            llm = ChatGroq(
-                model="llama-3.3-70b-versatile",
-                temperature=0.3,
-                groq_api_key=st.secrets["groq"]["api_key"],
-            )
-
-            # Updated prompt with medicine suggestions
-            system_prompt = """You are a helpful educational assistant summarizing blood test results.
-Use ONLY the provided report excerpts below.
-Your response MUST include:
+        elif record_count:
+            st.info(f"Analyzing {record_count} record(s) from: {source_info}")
 
-1. Identification of clearly abnormal values (where flag is 'High'/'Low' or result is outside ref range).
-2. For EACH abnormal test: very brief general interpretation.
-3. For EACH abnormal test: common lifestyle recommendations (diet, exercise, habits) AND typical/commonly associated medicines, supplements or treatments (e.g. statins for high cholesterol, iron for low hemoglobin, vitamin D for deficiency, etc.).
+            # LLM (shared client, created once per process)
+            llm = get_llm()
 
-VERY IMPORTANT – ALWAYS INCLUDE THIS EXACT DISCLAIMER AT  END OF YOUR RESPONSE:
-"THIS IS GENERAL EDUCATIONAL INFORMATION ONLY – NOT MEDICAL ADVICE, NOT A DIAGNOSIS, NOT A TREATMENT PLAN. 
-DO NOT TAKE ANY MEDICATION OR SUPPLEMENT BASED ON THIS OUTPUT. 
-CONSULT A QUALIFIED DOCTOR FOR PERSONALIZED INTERPRETATION, DIAGNOSIS AND PRESCRIPTION."
-
-Never recommend specific doses, brands or starting/stopping medicines.
-Keep response clear, structured and concise.
-
-Context (blood reports):
-{context}"""
-
-            prompt = ChatPromptTemplate.from_messages(
-                [("system", system_prompt), ("human", "{input}")]
-            )
-
-            combine_docs_chain = create_stuff_documents_chain(llm, prompt)
-            rag_chain = create_retrieval_chain(retriever, combine_docs_chain)
-
-            query = "Identify abnormal blood test results, explain briefly, list common general recommendations and typical medicines/supplements for each abnormal parameter."
             try:
-                result = rag_chain.invoke({"input": query})
-                answer_text = result["answer"]
-
+                # Abnormal rows were marked when indexed; the pre-filtered ones are
+                # ranked by relevance and packed into a fixed token budget
+                tokenizer = get_tokenizer()
+                with EMBEDDING_LOCK:
+                    docs, counts, packing = abnormal_context(
+                        index, filters, ANALYSIS_QUERY, tokenizer=tokenizer
+                    )
+                st.caption(
+                    f"{counts['abnormal']} of {counts['rows']} row(s) outside their reference "
+                    f"range or flagged; sending {packing['rows']} of them plus a per-test summary "
+                    f"(~{packing['tokens']}/{packing['budget']} context tokens)."
+                )
                 st.subheader(f"🔎 AI Analysis (based on {source_info})")
-                st.markdown(answer_text)
+
+                # Same model + prompt + retrieved rows + question → reuse the stored answer
+                answer_cache = get_answer_cache()
+                cache_key = answer_cache.key(model_id(llm), SYSTEM_PROMPT, docs, ANALYSIS_QUERY)
+                answer_text = answer_cache.get(cache_key)
+                if answer_text is not None:
+                    st.markdown(answer_text)
+                    st.caption("⚡ Served from the answer cache (no underlying record changed)")
+                else:
+                    # Tokens are rendered as they arrive; write_stream returns the full text
+                    timings = {}
+                    answer_text = st.write_stream(
+                        stream_answer(build_answer_chain(llm), ANALYSIS_QUERY, docs, timings)
+                    )
+                    st.caption(
+                        f"First token after {timings.get('first_token_s', 0):.2f}s · "
+                        f"complete after {timings.get('total_s', 0):.2f}s"
+                    )
+                    answer_cache.put(cache_key, answer_text, doc_report_ids(docs))
 
                 # Download RAG result as text
                 st.download_button(
@@ -242,4 +277,8 @@ Context (blood reports):
             except Exception as e:
                 st.error(f"Error during analysis: {str(e)}")
 
+    # Where the time went: TiDB (db.*), torch (embed.*, model.load), FAISS (index.*), Groq (llm.*)
+    with st.expander("⏱️ Stage timings"):
+        st.dataframe(rag_trace.table(), use_container_width=True)
+
 
@@ -1,32 +1,13 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from groq import Groq
 
-st.title("RAG Demo: Blood Reports + Groq")
-
-# --- TiDB Config ---
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
+from db import run_query
 
-# Write SSL certificate string from secrets to a temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
+st.title("RAG Demo: Blood Reports + Groq")
 
 # --- Fetch Data from TiDB ---
 try:
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 5;")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    rows = run_query("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 5;", fetch=True)
     st.success("✅ TiDB Connected and data retrieved!")
     st.write(rows)
 except Exception as e:
@@ -1,23 +1,9 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from groq import Groq
 
-st.title("RAG Demo: Blood Reports Assistant")
-
-# --- TiDB Config ---
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
+from db import run_query
 
-# Write SSL certificate string from secrets to a temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
+st.title("RAG Demo: Blood Reports Assistant")
 
 # --- User Query ---
 user_question = st.text_input("Ask about blood reports (e.g., 'Show me abnormal glucose results')")
@@ -25,15 +11,9 @@ user_question = st.text_input("Ask about blood reports (e.g., 'Show me abnormal
 if user_question:
     # --- Query TiDB ---
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
         # Simple retrieval: fetch relevant rows
         # For demo, we just pull all rows; later you can add WHERE clauses or embeddings
-        cursor.execute("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 20;")
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        rows = run_query("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 20;", fetch=True)
         st.success("✅ TiDB Connected and data retrieved!")
     except Exception as e:
         st.error(f"❌ TiDB query failed: {e}")
@@ -1,52 +1,22 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from groq import Groq
 
-st.title("RAG Demo: Blood Reports Assistant (Semantic Filtering)")
-
-# --- TiDB Config ---
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
+from lab_tests import get_resolver, latest_results
 
-# Write SSL certificate string from secrets to a temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
+st.title("RAG Demo: Blood Reports Assistant (Semantic Filtering)")
 
 # --- User Query ---
 user_question = st.text_input("Ask about blood reports (e.g., 'Show me abnormal glucose results')")
 
 if user_question:
-    # --- Simple semantic filter: extract keywords ---
-    # For demo, we just look for test names mentioned in the question
-    keywords = []
-    for kw in ["glucose", "cholesterol", "hemoglobin", "platelet", "WBC", "RBC"]:
-        if kw.lower() in user_question.lower():
-            keywords.append(kw)
-
-    # --- Query TiDB ---
+    # --- Resolve test names (synonyms + stored names, one trie pass) ---
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        if keywords:
-            # Build WHERE clause dynamically
-            conditions = " OR ".join([f"test_name LIKE '%{kw}%'" for kw in keywords])
-            query = f"SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports WHERE {conditions} LIMIT 50;"
-        else:
-            # Fallback: fetch all rows if no keyword detected
-            query = "SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 20;"
+        test_names = get_resolver().match(user_question)
+        if test_names:
+            st.caption(f"Matched tests: {', '.join(test_names)}")
 
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        # --- Query TiDB (latest results per matched test, or latest overall) ---
+        rows = latest_results(test_names, limit=50 if test_names else 20)
         st.success(f"✅ TiDB Connected and retrieved {len(rows)} rows")
     except Exception as e:
         st.error(f"❌ TiDB query failed: {e}")
@@ -1,35 +1,16 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from groq import Groq
 import faiss
 import numpy as np
 
-st.title("RAG Demo: Blood Reports Assistant (Embeddings + Vector Search)")
-
-# --- TiDB Config ---
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
+from db import run_query
+from embedding_batch import client_embed_batch, embed_in_batches
 
-# Write SSL certificate string from secrets to a temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
+st.title("RAG Demo: Blood Reports Assistant (Embeddings + Vector Search)")
 
 # --- Fetch Data from TiDB ---
 def fetch_reports():
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 200;")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+    return run_query("SELECT id, timestamp, test_name, result, unit, ref_range, flag FROM blood_reports LIMIT 200;", fetch=True)
 
 # --- Build Embeddings Index ---
 def build_index(rows, client):
@@ -37,10 +18,8 @@ def build_index(rows, client):
         f"{r['timestamp']} - {r['test_name']}: {r['result']} {r['unit']} (Ref: {r['ref_range']}, Flag: {r['flag']})"
         for r in rows
     ]
-    embeddings = []
-    for txt in texts:
-        emb = client.embeddings.create(model="llama-3.1-8b-embedding", input=txt)
-        embeddings.append(emb.data[0].embedding)
+    # A handful of batched requests (run concurrently) instead of one per row
+    embeddings = embed_in_batches(client_embed_batch(client, "llama-3.1-8b-embedding"), texts)
     embeddings = np.array(embeddings).astype("float32")
 
     index = faiss.IndexFlatL2(embeddings.shape[1])
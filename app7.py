@@ -1,8 +1,12 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from datetime import datetime
 
+from db import run_query
+from patient_search import search_patients
+from records import insert_reports
+from embedding_batch import BatchedEmbeddings
+from embedding_cache import CachedEmbeddings
+
 
 # Use this instead (from langchain-classic):
 from langchain_classic.chains import create_retrieval_chain
@@ -18,32 +22,6 @@ st.set_page_config(page_title="Blood Reports Manager + RAG", layout="wide")
 
 st.title("Blood Reports Database Manager + RAG Analysis")
 
-# ── TiDB Connection Config ──────────────────────────────────────────
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
-
-# Write CA certificate to temp file (TiDB usually needs SSL)
-with tempfile.NamedTemporaryFile(delete=False) as tmp_ca:
-    tmp_ca.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp_ca.name
-    db_config["ssl_verify_cert"] = True
-
-# ── Helper: run query ───────────────────────────────────────────────
-def run_query(query, params=None, fetch=False):
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(query, params or ())
-    result = cursor.fetchall() if fetch else None
-    conn.commit()
-    cursor.close()
-    conn.close()
-    return result
-
 # ── Insert new record ───────────────────────────────────────────────
 st.header("➕ Insert Record")
 with st.form("insert_form"):
@@ -59,14 +37,7 @@ with st.form("insert_form"):
 
     submitted = st.form_submit_button("Insert Record")
     if submitted and name and test_name:
-        run_query(
-            """
-            INSERT INTO blood_reports 
-            (name, test_name, result, unit, ref_range, flag, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (name, test_name, result, unit, ref_range, flag, datetime.now()),
-        )
+        insert_reports([(name, test_name, result, unit, ref_range, flag, datetime.now())])
         st.success("✅ Record inserted!")
     elif submitted:
         st.warning("Please fill at least Patient Name and Test Name.")
@@ -81,19 +52,25 @@ with col2:
 with col3:
     end_date = st.date_input("To", value=datetime.now().date())
 
+# Candidate patients come from the in-memory name index (prefix, typo and
+# sound-alike matches), so the query is an indexed IN lookup instead of a
+# LIKE '%...%' scan over every row
 if st.button("Search"):
     if search_name:
+        candidates = [name for name, _, _ in search_patients(search_name)]
+        placeholders = ", ".join(["%s"] * len(candidates))
         rows = run_query(
-            """
+            f"""
             SELECT * FROM blood_reports 
-            WHERE name LIKE %s 
+            WHERE name IN ({placeholders}) 
             AND timestamp BETWEEN %s AND %s
             ORDER BY timestamp DESC
             """,
-            (f"%{search_name}%", start_date, end_date),
+            (*candidates, start_date, end_date),
             fetch=True,
-        )
+        ) if candidates else []
         if rows:
+            st.caption("Matched: " + ", ".join(candidates))
             st.dataframe(rows)
         else:
             st.info("No records found.")
@@ -109,7 +86,7 @@ if st.button("Show All"):
     else:
         st.info("Database is empty.")
 
-# ── RAG Analysis (lazy – only runs when clicked) ───────────────────
+# ── RAG Analysis (lazy – only runs when clicked) ────────────────────
 st.header("🧠 RAG: Abnormal Reports & Recommendations")
 
 if st.button("Run RAG Analysis (may take 5–20 seconds)"):
@@ -129,7 +106,11 @@ if st.button("Run RAG Analysis (may take 5–20 seconds)"):
                 )
 
             # Embed + FAISS (happens only here → fast startup)
-            embeddings = OpenAIEmbeddings(openai_api_key=st.secrets["openai"]["api_key"])
+            # Cached by text hash – only new or edited rows hit the paid endpoint
+            openai_embeddings = OpenAIEmbeddings(openai_api_key=st.secrets["openai"]["api_key"])
+            embeddings = CachedEmbeddings(
+                BatchedEmbeddings(openai_embeddings), f"openai/{openai_embeddings.model}"
+            )
             vectorstore = FAISS.from_texts(texts, embeddings)
             retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
 
@@ -1,12 +1,13 @@
 import streamlit as st
-import mysql.connector
-import tempfile
 from datetime import datetime, timedelta
 
+import db
+from async_core import query_with_warmup, run_sync
+from models import get_embeddings, get_llm, model_metrics, warm_up
+from records import insert_reports
+
 # ── LangChain imports ───────────────────────────────────────────────
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
 from langchain_classic.chains import create_retrieval_chain
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
@@ -15,36 +16,19 @@ st.set_page_config(page_title="Blood Reports Manager + RAG", layout="wide")
 
 st.title("Blood Reports Database Manager + RAG Analysis")
 
-# ── TiDB Config ─────────────────────────────────────────────────────
-db_config = {
-    "host": st.secrets["tidb"]["host"],
-    "port": st.secrets["tidb"]["port"],
-    "user": st.secrets["tidb"]["user"],
-    "password": st.secrets["tidb"]["password"],
-    "database": st.secrets["tidb"]["database"],
-}
-
-# Write SSL certificate to temporary file
-with tempfile.NamedTemporaryFile(delete=False) as tmp:
-    tmp.write(st.secrets["tidb"]["ssl_ca"].encode())
-    db_config["ssl_ca"] = tmp.name
-    db_config["ssl_verify_cert"] = True
+# Load embedding model, tokenizer and Groq client in the background (once per process)
+warm_up()
+with st.sidebar.expander("⚙️ Model cache"):
+    st.json(model_metrics())
 
 # ── Helper function to run SQL queries ──────────────────────────────
+# Connections come from the shared pool in db.py (one per server process)
 def run_query(query, params=None, fetch=False):
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        result = cursor.fetchall() if fetch else None
-        conn.commit()
+        return db.run_query(query, params, fetch)
     except Exception as e:
         st.error(f"Database error: {e}")
-        result = None
-    finally:
-        cursor.close()
-        conn.close()
-    return result
+        return None
 
 # ── Insert Record Form ──────────────────────────────────────────────
 st.header("➕ Insert Record")
@@ -62,15 +46,12 @@ with st.form("insert_form"):
     submitted = st.form_submit_button("Insert Record")
     if submitted:
         if name and test_name:
-            run_query(
-                """
-                INSERT INTO blood_reports 
-                (name, test_name, result, unit, ref_range, flag, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (name.strip(), test_name, result, unit, ref_range, flag, datetime.now()),
-            )
-            st.success("✅ Record inserted successfully!")
+            try:
+                insert_reports([(name.strip(), test_name, result, unit, ref_range, flag, datetime.now())])
+            except Exception as e:
+                st.error(f"Database error: {e}")
+            else:
+                st.success("✅ Record inserted successfully!")
         else:
             st.warning("Please fill at least Patient Name and Test Name.")
 
@@ -137,7 +118,12 @@ if st.button("Run RAG Analysis (may take 10–30s first time)"):
             rows = st.session_state.last_search_rows
             source_info = f"filtered search results for exact name '{st.session_state.last_search_name}'"
         else:
-            rows = run_query("SELECT * FROM blood_reports", fetch=True)
+            # The table is read while the embedding model / Groq client finish loading
+            try:
+                rows = run_sync(query_with_warmup("SELECT * FROM blood_reports"))
+            except Exception as e:
+                st.error(f"Database error: {e}")
+                rows = None
             source_info = "ALL records in database (no search filter applied yet)"
 
         if not rows:
@@ -154,22 +140,14 @@ if st.button("Run RAG Analysis (may take 10–30s first time)"):
                     f"Flag: {r['flag']} | Date: {r.get('timestamp', 'N/A')}"
                 )
 
-            # Free local embeddings
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={"device": "cpu"},
-                encode_kwargs={"normalize_embeddings": True},
-            )
+            # Free local embeddings (loaded once per process)
+            embeddings = get_embeddings()
 
             vectorstore = FAISS.from_texts(texts, embeddings)
             retriever = vectorstore.as_retriever(search_kwargs={"k": min(5, len(texts))})
 
-            # Groq LLM
-            llm = ChatGroq(
-                model="llama-3.3-70b-versatile",
-                temperature=0.3,  # slightly higher for more explanatory output
-                groq_api_key=st.secrets["groq"]["api_key"],
-            )
+            # Groq LLM (temperature 0.3 – slightly higher for more explanatory output)
+            llm = get_llm()
 
             # Updated Prompt – now asks for common meds + strong disclaimer
             system_prompt = """You are a helpful educational assistant summarizing blood test results.
@@ -0,0 +1,99 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from models import get_embeddings, get_llm, get_tokenizer
+from vector_index import get_report_index
+
+LLM_CONCURRENCY = 8
+LLM_RETRIES = 4
+LLM_BACKOFF = 2.0  # seconds, doubled on each retry
+
+
+# ── Running coroutines from sync code ───────────────────────────────
+# Streamlit runs the page script in a plain thread, so asyncio.run works
+# there; under an already running loop the coroutine gets its own thread.
+def run_sync(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+# ── Database (blocking connector offloaded to threads) ──────────────
+# mysql.connector stays the driver: each call runs on a worker thread with
+# its own pooled connection, so several queries can be in flight at once.
+async def run_query(query, params=None, fetch=False, cache=False):
+    return await asyncio.to_thread(db.run_query, query, params, fetch, cache)
+
+
+async def execute_many(query, seq_params):
+    return await asyncio.to_thread(db.execute_many, query, seq_params)
+
+
+# ── Models ──────────────────────────────────────────────────────────
+async def load_models():
+    return await asyncio.gather(
+        asyncio.to_thread(get_embeddings),
+        asyncio.to_thread(get_tokenizer),
+        asyncio.to_thread(get_llm),
+    )
+
+
+async def load_rag_resources():
+    return await asyncio.gather(
+        asyncio.to_thread(get_report_index),
+        asyncio.to_thread(get_tokenizer),
+        asyncio.to_thread(get_llm),
+    )
+
+
+# The query runs while the embedding model / Groq client load
+async def query_with_warmup(query, params=None, cache=False):
+    rows, _ = await asyncio.gather(run_query(query, params, fetch=True, cache=cache), load_models())
+    return rows
+
+
+# ── LLM calls ───────────────────────────────────────────────────────
+# Spaces request starts evenly to stay under a requests-per-minute limit
+class AsyncRateLimiter:
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def ainvoke_with_retries(chain, inputs, limiter=None, retries=LLM_RETRIES, backoff=LLM_BACKOFF):
+    for attempt in range(retries + 1):
+        if limiter:
+            await limiter.wait()
+        try:
+            return await chain.ainvoke(inputs)
+        except Exception:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+# Independent prompts run concurrently (at most `concurrency` at once);
+# failures come back as exception objects in their slot
+async def invoke_many(chain, inputs_list, concurrency=LLM_CONCURRENCY, limiter=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(inputs):
+        async with semaphore:
+            return await ainvoke_with_retries(chain, inputs, limiter)
+
+    return await asyncio.gather(*(one(inputs) for inputs in inputs_list), return_exceptions=True)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import abnormal
+import async_core
+import db
+import records
+from bulk_import import batched
+from context_builder import pack_rows
+from models import get_llm
+from rag import SYSTEM_PROMPT, build_answer_chain, model_id
+
+BATCH_WORKERS = 8           # concurrent Groq requests
+BATCH_REQUESTS_PER_MIN = 30  # Groq free tier; raise for paid plans
+BATCH_PATIENT_CHUNK = 200   # patients fetched per query
+BATCH_WRITE_SIZE = 100      # summaries per upsert
+MAX_REPORTED_ERRORS = 50
+
+PATIENT_QUERY = "Summarize this patient's abnormal blood test results, explain briefly, and list common general recommendations and typical medicines/supplements for each abnormal parameter."
+
+NO_ABNORMAL_SUMMARY = "No abnormal values: every result is within its reference range and unflagged."
+
+UPSERT_SQL = """
+    INSERT INTO report_summaries
+    (name, summary, results, abnormal, model, context_hash, generated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        summary = VALUES(summary), results = VALUES(results), abnormal = VALUES(abnormal),
+        model = VALUES(model), context_hash = VALUES(context_hash), generated_at = VALUES(generated_at)
+"""
+
+
+# ── Patient rows ────────────────────────────────────────────────────
+def patient_names(limit=None):
+    query = (
+        "SELECT name FROM patients p "
+        "WHERE EXISTS (SELECT 1 FROM lab_results r WHERE r.patient_id = p.id) ORDER BY name"
+    )
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return [r["name"] for r in db.run_query(query, fetch=True) or []]
+
+
+# One IN (...) query per chunk of patients (served by idx_lab_results_patient_ts)
+def patient_frames(chunk):
+    placeholders = ", ".join(["%s"] * len(chunk))
+    rows = records.fetch_reports(
+        f"JOIN patients p ON p.id = r.patient_id WHERE p.name IN ({placeholders}) "
+        "ORDER BY r.patient_id, r.timestamp",
+        tuple(chunk),
+    )
+    return list(pd.DataFrame(rows).groupby("name", sort=False)) if rows else []
+
+
+def existing_hashes():
+    rows = db.run_query("SELECT name, context_hash FROM report_summaries", fetch=True) or []
+    return {r["name"]: r["context_hash"] for r in rows}
+
+
+# Abnormal rows (latest first) under the per-test summary, packed into the
+# usual token budget. Character-estimated so the batch never loads torch.
+def patient_context(frame):
+    flagged = abnormal.detect(frame)
+    abnormal_rows = flagged[flagged["abnormal"]].sort_values("timestamp", ascending=False)
+    rows = abnormal_rows.astype(object).where(abnormal_rows.notna(), None).to_dict("records")
+    summary = abnormal.summary_text(abnormal.summarize(flagged))
+    docs, _ = pack_rows(rows, preamble=summary)
+    return docs, len(flagged), len(abnormal_rows)
+
+
+def context_hash(model, docs):
+    digest = hashlib.sha256(f"{model}\0{SYSTEM_PROMPT}\0{PATIENT_QUERY}".encode())
+    for d in docs:
+        digest.update(b"\0" + d.page_content.encode())
+    return digest.hexdigest()
+
+
+# ── Batch run ───────────────────────────────────────────────────────
+class BatchStats:
+    def __init__(self):
+        self.summarized = 0
+        self.normal = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def patients_per_min(self):
+        done = self.summarized + self.normal
+        return done * 60 / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (
+            f"{self.summarized} summarized, {self.normal} without abnormal values, "
+            f"{self.skipped} unchanged, {self.failed} failed in {self.seconds:.0f}s "
+            f"({self.patients_per_min:,.1f} patients/min)"
+        )
+
+
+def write_summaries(rows):
+    for batch in batched(rows, BATCH_WRITE_SIZE):
+        db.execute_many(UPSERT_SQL, batch)
+
+
+# Patients whose context (rows, prompt, model) is unchanged since the last
+# run are skipped unless force=True. While one chunk of patients is being
+# summarized, the next chunk is already read from the database and the
+# previous chunk's summaries are being written.
+async def run_batch_async(names=None, workers=BATCH_WORKERS, per_minute=BATCH_REQUESTS_PER_MIN,
+                          force=False, limit=None, on_progress=None):
+    stats = BatchStats()
+
+    async def previous_hashes():
+        return {} if force else await asyncio.to_thread(existing_hashes)
+
+    async def all_names():
+        return names or await asyncio.to_thread(patient_names, limit)
+
+    # The Groq client is created while the patient list is read
+    llm, previous, names = await asyncio.gather(
+        asyncio.to_thread(get_llm), previous_hashes(), all_names()
+    )
+    chain = build_answer_chain(llm)
+    model = model_id(llm)
+    limiter = async_core.AsyncRateLimiter(per_minute)
+
+    chunks = list(batched(names, BATCH_PATIENT_CHUNK))
+    fetch = asyncio.create_task(asyncio.to_thread(patient_frames, chunks[0])) if chunks else None
+    writes = []
+    for i in range(len(chunks)):
+        frames = await fetch
+        if i + 1 < len(chunks):
+            fetch = asyncio.create_task(asyncio.to_thread(patient_frames, chunks[i + 1]))
+
+        rows, pending = [], []
+        for name, frame in frames:
+            docs, results, abnormal_count = patient_context(frame)
+            digest = context_hash(model, docs)
+            if previous.get(name) == digest:
+                stats.skipped += 1
+            elif not abnormal_count:
+                stats.normal += 1
+                rows.append((name, NO_ABNORMAL_SUMMARY, results, 0, model, digest, datetime.now()))
+            else:
+                pending.append((name, docs, results, abnormal_count, digest))
+
+        answers = await async_core.invoke_many(
+            chain,
+            [{"input": PATIENT_QUERY, "context": docs} for _, docs, _, _, _ in pending],
+            concurrency=workers,
+            limiter=limiter,
+        )
+        for (name, _, results, abnormal_count, digest), answer in zip(pending, answers):
+            if isinstance(answer, Exception):
+                stats.failed += 1
+                if len(stats.errors) < MAX_REPORTED_ERRORS:
+                    stats.errors.append(f"{name}: {answer}")
+                continue
+            stats.summarized += 1
+            rows.append((name, answer, results, abnormal_count, model, digest, datetime.now()))
+
+        writes.append(asyncio.create_task(asyncio.to_thread(write_summaries, rows)))
+        stats.seconds = time.perf_counter() - stats.started
+        if on_progress:
+            on_progress(stats)
+
+    await asyncio.gather(*writes)
+    stats.seconds = time.perf_counter() - stats.started
+    return stats
+
+
+def run_batch(*args, **kwargs):
+    return async_core.run_sync(run_batch_async(*args, **kwargs))
+
+
+# ── CLI ─────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Write per-patient abnormal-result summaries to report_summaries")
+    parser.add_argument("names", nargs="*", help="patients to summarize (default: all)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--rpm", type=float, default=BATCH_REQUESTS_PER_MIN, help="Groq requests per minute")
+    parser.add_argument("--limit", type=int, help="only the first N patients (by name)")
+    parser.add_argument("--force", action="store_true", help="re-summarize patients whose data is unchanged")
+    args = parser.parse_args()
+
+    stats = run_batch(
+        args.names, args.workers, args.rpm, args.force, args.limit,
+        on_progress=lambda s: print(f"\r{s.summary()}", end="", flush=True),
+    )
+    print(f"\r{stats.summary()}")
+    for error in stats.errors:
+        print(f"  failed {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mysql.connector
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+
+import bulk_import
+import db
+import export
+import generate_data
+import migrations
+import records
+import reports
+import tracing
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from rag import ANALYSIS_QUERY, abnormal_context, build_answer_chain, stream_answer
+from vector_index import ReportIndex
+
+# Runs the apps' query, export and RAG code paths against a local
+# MySQL-compatible server with a deterministic embedder and chat model, so
+# numbers only move when our code (or the database) does.
+PATHS = ["insert", "search", "search_cached", "show_all", "export", "rag"]
+SEED_PATIENTS_PER_ROW = 0.005  # ~200 rows per patient
+FAKE_EMBED_DIM = 384           # same width as all-MiniLM-L6-v2
+FAKE_ANSWER = (
+    "Glucose is above its reference range; common general recommendations include diet and exercise. "
+    "THIS IS GENERAL EDUCATIONAL INFORMATION ONLY – NOT MEDICAL ADVICE."
+)
+
+# ── Local database ──────────────────────────────────────────────────
+def db_settings(args):
+    return {
+        "host": args.host, "port": args.port, "user": args.user,
+        "password": args.password, "database": args.database,
+        "pool_size": max(args.concurrency, bulk_import.BULK_WORKERS) + 1,
+    }
+
+
+def connect(args):
+    settings = db_settings(args)
+    server = mysql.connector.connect(**{k: settings[k] for k in ("host", "port", "user", "password")})
+    cursor = server.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+    cursor.close()
+    server.close()
+    db.use_settings(settings)
+    migrations.migrate(log=lambda msg: None)
+
+
+def ensure_rows(rows, seed_value, reset=False):
+    if reset:
+        db.run_query("TRUNCATE TABLE lab_results")
+    existing = db.run_query("SELECT COUNT(*) AS n FROM lab_results", fetch=True)[0]["n"]
+    patients = max(1, int(rows * SEED_PATIENTS_PER_ROW))
+    if existing < rows:
+        stats = generate_data.load_db(generate_data.generate(rows - existing, patients, seed_value + existing))
+        print(f"seeded: {stats.summary()}", file=sys.stderr)
+    return patients
+
+
+# ── Measurement ─────────────────────────────────────────────────────
+# ru_maxrss is the high-water mark of the whole process, so every path
+# runs in a fresh process of its own (see run_paths)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def measure(path, op, iterations, concurrency=1):
+    durations = []
+
+    def timed(i):
+        start = time.perf_counter()
+        op(i)
+        durations.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, range(iterations)))
+    else:
+        for i in range(iterations):
+            timed(i)
+    wall = time.perf_counter() - start
+
+    ms = np.array(durations) * 1000
+    return {
+        "path": path,
+        "n": iterations,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "ops_per_s": round(iterations / wall, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),  # high-water mark of this path's process so far
+    }
+
+
+# ── Paths ───────────────────────────────────────────────────────────
+def run_path(path, patients, args):
+    rng = random.Random(args.seed)
+
+    # Generated timestamps cover the 5 years up to generate_data.GEN_END
+    def random_search():
+        start = datetime(2021, 1, 1) + timedelta(days=rng.randrange(0, 5 * 365 - 90))
+        return generate_data.patient_name(rng.randrange(patients)), start, start + timedelta(days=90)
+
+    def search(cache):
+        def op(i):
+            if cache:
+                name, start, end = generate_data.patient_name(0), datetime(2021, 1, 1), datetime(2026, 1, 1)
+            else:
+                name, start, end = random_search()
+            records.search_reports(name, start, end, cache=cache)
+        return op
+
+    page = {"after": None}
+
+    def show_all(i):
+        _, page["after"] = reports.fetch_page(50, page["after"])
+
+    if path == "insert":
+        inserts = [row for df in generate_data.generate(args.iterations, patients, args.seed + 1)
+                   for row in generate_data.frame_rows(df)]
+        return [measure("insert", lambda i: records.insert_reports([inserts[i]]), args.iterations, args.concurrency)]
+    if path == "search":
+        return [measure("search", search(False), args.iterations, args.concurrency)]
+    if path == "search_cached":
+        return [measure("search_cached", search(True), args.iterations, args.concurrency)]
+    if path == "show_all":
+        return [measure("show_all", show_all, args.iterations)]
+    if path.startswith("export:"):
+        fmt = path.split(":", 1)[1]
+        return [measure(path, lambda i: export.export_query("SELECT * FROM blood_reports", fmt=fmt).close(), 1)]
+    if path == "rag":
+        return run_rag(patients, args, rng)
+    return []
+
+
+# Runs in a spawned process: a fresh interpreter, so its peak RSS and
+# stage timings belong to this path alone
+def _run_in_child(path, patients, args):
+    db.use_settings(db_settings(args))
+    results = run_path(path, patients, args)
+    return results, [{"path": path, **stage} for stage in tracing.latency_summary()]
+
+
+def run_paths(paths, patients, args):
+    results, stages = [], []
+    context = multiprocessing.get_context("spawn")
+    # Each export format gets a process of its own too
+    tasks = []
+    for path in paths:
+        tasks.extend([f"export:{fmt}" for fmt in export.FORMATS] if path == "export" else [path])
+    for path in tasks:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            path_results, path_stages = pool.submit(_run_in_child, path, patients, args).result()
+        results.extend(path_results)
+        stages.extend(path_stages)
+    return results, stages
+
+
+def run_rag(patients, args, rng):
+    workdir = tempfile.mkdtemp(prefix="bench_rag_")
+    embeddings = CachedEmbeddings(
+        DeterministicFakeEmbedding(size=FAKE_EMBED_DIM), "fake/deterministic",
+        cache=EmbeddingCache(os.path.join(workdir, "embeddings.sqlite")),
+    )
+    index = ReportIndex(os.path.join(workdir, "index.sqlite"), embeddings)
+    llm = FakeListChatModel(responses=[FAKE_ANSWER], sleep=args.llm_token_delay or None)
+    chain = build_answer_chain(llm)
+
+    # rag:analysis runs in the same process, so its peak RSS includes the sync
+    results = [measure("rag:index_sync", lambda i: index.sync(), 1)]
+
+    def analyze(i):
+        filters = {"name": generate_data.patient_name(rng.randrange(patients))}
+        docs, _, _ = abnormal_context(index, filters, ANALYSIS_QUERY)
+        for _ in stream_answer(chain, ANALYSIS_QUERY, docs, {}):
+            pass
+
+    results.append(measure("rag:analysis", analyze, args.iterations, args.concurrency))
+    return results
+
+
+# ── Report / regression check ───────────────────────────────────────
+def print_table(rows):
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = [max(len(str(c)), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def regressions(results, baseline, tolerance):
+    base = {r["path"]: r for r in baseline["results"]}
+    found = []
+    for r in results:
+        before = base.get(r["path"])
+        if before and r["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{r['path']}: p95 {before['p95_ms']}ms → {r['p95_ms']}ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app code paths against a local MySQL-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="blood_reports_bench")
+    parser.add_argument("--rows", type=int, default=10_000, help="seed the table up to this many rows (e.g. 1000000)")
+    parser.add_argument("--reset", action="store_true", help="truncate and re-seed blood_reports first")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"comma-separated subset of {PATHS}")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1, help="threads issuing the insert/search/rag ops")
+    parser.add_argument("--llm-token-delay", type=float, default=0.0, help="seconds per streamed chunk of the fake LLM")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output; exit 1 if any p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 increase over the baseline")
+    args = parser.parse_args()
+
+    connect(args)
+    patients = ensure_rows(args.rows, args.seed, args.reset)
+
+    results, stages = run_paths([p.strip() for p in args.paths.split(",") if p.strip()], patients, args)
+    print_table(results)
+    print()
+    print_table(stages)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": args.rows, "args": vars(args), "results": results,
+                       "stages": stages}, f, indent=2, default=str)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import csv
+import io
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import islice
+
+import records
+
+BULK_BATCH_SIZE = 1000  # rows per multi-row INSERT / transaction
+BULK_WORKERS = 4        # parallel loaders, each on its own pooled connection
+MAX_REPORTED_ERRORS = 50
+
+HL7_FLAGS = {"H": "High", "HH": "High", "L": "Low", "LL": "Low", "N": "Normal", "A": "Abnormal"}
+
+
+# ── Parsers (streaming, one record at a time) ───────────────────────
+# CSV header uses the blood_reports column names; `timestamp` is optional
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    reader.fieldnames = [f.strip().lower() for f in reader.fieldnames or []]
+    for record in reader:
+        record["_line"] = reader.line_num
+        yield record
+
+
+# HL7 v2-style export: PID-5 carries the patient name (family^given) and
+# each OBX segment one result (OBX-3 test, -5 value, -6 unit, -7 range,
+# -8 abnormal flag, -14 observation time)
+def parse_hl7(lines):
+    name = None
+    for line_num, line in enumerate(lines, start=1):
+        fields = line.strip().split("|")
+        segment = fields[0]
+        if segment == "PID":
+            parts = fields[5].split("^") if len(fields) > 5 else []
+            name = " ".join(p for p in reversed(parts[:2]) if p) or None
+        elif segment == "OBX":
+            fields += [""] * (15 - len(fields))
+            test = fields[3].split("^")
+            yield {
+                "_line": line_num,
+                "name": name,
+                "test_name": test[1] if len(test) > 1 and test[1] else test[0],
+                "result": fields[5],
+                "unit": fields[6],
+                "ref_range": fields[7],
+                "flag": HL7_FLAGS.get(fields[8], fields[8]),
+                "timestamp": fields[14],
+            }
+
+
+def parser_for(filename):
+    return parse_hl7 if filename.lower().endswith((".hl7", ".txt")) else parse_csv
+
+
+# ── Validation ──────────────────────────────────────────────────────
+# HL7 DTM by length: strptime alone would read "202401020830" as
+# 08:03:00, since %M and %S also accept a single digit
+HL7_TIME_FORMATS = {14: "%Y%m%d%H%M%S", 12: "%Y%m%d%H%M", 8: "%Y%m%d"}
+
+
+def parse_timestamp(value):
+    value = (value or "").strip()
+    if not value:
+        return datetime.now()
+    if value.isdigit() and len(value) in HL7_TIME_FORMATS:
+        return datetime.strptime(value, HL7_TIME_FORMATS[len(value)])
+    return datetime.fromisoformat(value)
+
+
+def validate(record):
+    name = (record.get("name") or "").strip()
+    test_name = (record.get("test_name") or "").strip()
+    if not name or not test_name:
+        raise ValueError("name and test_name are required")
+    try:
+        result = float(record.get("result"))
+    except (TypeError, ValueError):
+        raise ValueError(f"result is not numeric: {record.get('result')!r}")
+    try:
+        timestamp = parse_timestamp(record.get("timestamp"))
+    except ValueError:
+        raise ValueError(f"bad timestamp: {record.get('timestamp')!r}")
+    return (
+        name,
+        test_name,
+        result,
+        (record.get("unit") or "").strip(),
+        (record.get("ref_range") or "").strip(),
+        (record.get("flag") or "").strip(),
+        timestamp,
+    )
+
+
+# ── Loader ──────────────────────────────────────────────────────────
+class ImportStats:
+    def __init__(self):
+        self.loaded = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.loaded / self.seconds if self.seconds else 0.0
+
+    def reject(self, source, line, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"{source}:{line}: {error}")
+
+    def summary(self):
+        return (
+            f"{self.loaded} rows loaded, {self.rejected} rejected "
+            f"in {self.seconds:.1f}s ({self.rows_per_sec:,.0f} rows/sec)"
+        )
+
+
+def valid_rows(records, stats, source):
+    for record in records:
+        try:
+            yield validate(record)
+        except ValueError as e:
+            stats.reject(source, record.get("_line"), e)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Each batch is one multi-row INSERT into lab_results (records.py) committed
+# as one transaction; at most 2×workers batches are in flight to bound memory.
+def load_rows(rows, stats, batch_size=BULK_BATCH_SIZE, workers=BULK_WORKERS, on_progress=None):
+    def finish(done):
+        for future in done:
+            stats.loaded += future.result()
+        stats.seconds = time.perf_counter() - stats.started
+        if on_progress:
+            on_progress(stats)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in batched(rows, batch_size):
+            pending.add(pool.submit(records.insert_reports, batch))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+        finish(pending)
+    return stats
+
+
+def import_stream(lines, source, batch_size=BULK_BATCH_SIZE, workers=BULK_WORKERS,
+                  stats=None, on_progress=None):
+    stats = stats or ImportStats()
+    records = parser_for(source)(lines)
+    return load_rows(valid_rows(records, stats, source), stats, batch_size, workers, on_progress)
+
+
+# Uploaded files (bytes) from st.file_uploader
+def import_upload(uploaded, **kwargs):
+    lines = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+    return import_stream(lines, uploaded.name, **kwargs)
+
+
+# New rows become searchable through the vector index watermark sync
+def sync_vector_index():
+    from vector_index import get_report_index
+    return get_report_index().sync()
+
+
+# ── CLI ─────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load lab result files into blood_reports")
+    parser.add_argument("files", nargs="+", help="CSV (.csv) or HL7-style (.hl7/.txt) files")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--no-index", action="store_true", help="skip the vector index sync")
+    args = parser.parse_args()
+
+    stats = ImportStats()
+    for path in args.files:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            import_stream(
+                f, path, args.batch_size, args.workers, stats,
+                on_progress=lambda s: print(f"\r{s.summary()}", end="", flush=True),
+            )
+    print(f"\r{stats.summary()}")
+    for error in stats.errors:
+        print(f"  rejected {error}")
+
+    if not args.no_index and stats.loaded:
+        print(f"Vector index: {sync_vector_index()} new row(s) embedded")
+
+
+if __name__ == "__main__":
+    main()
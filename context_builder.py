@@ -0,0 +1,96 @@
+from langchain_core.documents import Document
+
+CONTEXT_TOKEN_BUDGET = 3000  # tokens of report context per request
+
+# Without a tokenizer, ~4 characters per token is close enough for English
+CHARS_PER_TOKEN = 4
+
+
+# ── Token counting ──────────────────────────────────────────────────
+# The sentence-transformers tokenizer is used as a stand-in for Llama's;
+# counts differ slightly, which the budget's headroom absorbs.
+def count_tokens(text, tokenizer=None):
+    if tokenizer is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _value(v):
+    try:
+        return f"{float(v):g}"
+    except (TypeError, ValueError):
+        return str(v)
+
+
+def _test_header(row):
+    return f"  {row['test_name']} [{row['unit'] or '-'}, ref {row['ref_range'] or '-'}]:"
+
+
+def _result(row):
+    flag = row.get("status") or row.get("flag") or ""
+    return f" {str(row['timestamp'])[:10]} {_value(row['result'])} {flag}".rstrip() + ";"
+
+
+# ── Packing ─────────────────────────────────────────────────────────
+# rows: structured report rows (dicts), most important first. Rows are
+# added greedily while they fit the budget, then rendered grouped by
+# patient (name written once) and by test (unit/range written once):
+#
+#   Patient: John Doe
+#     Glucose [mg/dL, ref 70-110]: 2024-01-02 150 High; 2024-03-01 180 High;
+def pack_rows(rows, budget=CONTEXT_TOKEN_BUDGET, tokenizer=None, preamble=None):
+    used = 0
+    docs = []
+    if preamble:
+        # The summary may take at most half the budget; rows get the rest
+        preamble = _fit_lines(preamble, budget // 2, tokenizer)
+        used = count_tokens(preamble, tokenizer)
+        docs.append(Document(page_content=preamble, metadata={"id": None, "kind": "summary"}))
+
+    groups = {}  # name → test → [row]
+    packed = 0
+    for row in rows:
+        patient = groups.get(row["name"])
+        cost = count_tokens(_result(row), tokenizer)
+        if patient is None:
+            cost += count_tokens(f"Patient: {row['name']}", tokenizer)
+        if patient is None or row["test_name"] not in patient:
+            cost += count_tokens(_test_header(row), tokenizer)
+        if used + cost > budget:
+            continue
+        used += cost
+        packed += 1
+        groups.setdefault(row["name"], {}).setdefault(row["test_name"], []).append(row)
+
+    for name, tests in groups.items():
+        lines = [f"Patient: {name}"]
+        ids = []
+        for test_rows in tests.values():
+            test_rows.sort(key=lambda r: str(r["timestamp"]))
+            lines.append(_test_header(test_rows[0]) + "".join(_result(r) for r in test_rows))
+            ids.extend(int(r["id"]) for r in test_rows)
+        docs.append(Document(page_content="\n".join(lines), metadata={"ids": ids, "kind": "rows"}))
+
+    return docs, {"tokens": used, "rows": packed, "candidates": len(rows), "budget": budget}
+
+
+# Keep whole lines from the top until the budget is used up
+def _fit_lines(text, budget, tokenizer):
+    if count_tokens(text, tokenizer) <= budget:
+        return text
+    kept = []
+    for line in text.splitlines():
+        if count_tokens("\n".join(kept + [line]), tokenizer) > budget:
+            break
+        kept.append(line)
+    return "\n".join(kept)
+
+
+# Report ids behind a packed context (for answer-cache invalidation)
+def doc_report_ids(docs):
+    ids = []
+    for d in docs:
+        if d.metadata.get("id") is not None:
+            ids.append(d.metadata["id"])
+        ids.extend(d.metadata.get("ids", []))
+    return ids
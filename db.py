@@ -0,0 +1,389 @@
+import queue
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mysql.connector
+import streamlit as st
+
+from tracing import span
+
+# ── Pool settings (override in secrets under [tidb]) ────────────────
+POOL_SIZE = 5             # max open connections per server process
+POOL_TIMEOUT = 10         # seconds to wait for a free connection
+POOL_RECYCLE = 300        # idle seconds before a connection is pinged again
+POOL_MAX_LIFETIME = 3600  # seconds before a connection is replaced outright
+
+# ── Query cache settings ────────────────────────────────────────────
+QUERY_CACHE_TTL = 60            # seconds a cached result stays valid
+QUERY_CACHE_MAX_ENTRIES = 256   # least recently used results are dropped first
+
+
+# ── TiDB Config ─────────────────────────────────────────────────────
+# Scripts and benchmarks can point db.py at another MySQL-compatible server
+# (same keys as the [tidb] secrets section; ssl_ca optional) before first use
+_settings_override = None
+
+
+def use_settings(settings):
+    global _settings_override
+    _settings_override = dict(settings)
+    get_pool.clear()
+    get_query_cache.clear()
+
+
+def db_settings():
+    return _settings_override if _settings_override is not None else st.secrets["tidb"]
+
+
+def load_db_config():
+    tidb = db_settings()
+    db_config = {
+        "host": tidb["host"],
+        "port": tidb["port"],
+        "user": tidb["user"],
+        "password": tidb["password"],
+        "database": tidb["database"],
+    }
+
+    # Write SSL certificate to temporary file
+    if tidb.get("ssl_ca"):
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(tidb["ssl_ca"].encode())
+            db_config["ssl_ca"] = tmp.name
+            db_config["ssl_verify_cert"] = True
+
+    return db_config
+
+
+# ── Connection pool ─────────────────────────────────────────────────
+class ConnectionPool:
+    def __init__(self, config, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, max_lifetime=POOL_MAX_LIFETIME):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.max_lifetime = max_lifetime
+
+        # LIFO so the most recently used (warmest) connection is reused first
+        # and the rest can age out through the recycle check.
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            "opened": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "checkout_ms_total": 0.0,
+            "checkout_ms_max": 0.0,
+            "last_checkout_ms": 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.config)
+        self._count("opened")
+        return conn, time.monotonic()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count("closed")
+
+    def _healthy(self, conn, created, last_used):
+        now = time.monotonic()
+        if now - created > self.max_lifetime:
+            return False
+        if now - last_used > self.recycle:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, created, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if self._healthy(conn, created, last_used):
+                return conn, created
+            self._close(conn)
+
+    def acquire(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                f"No database connection available within {self.timeout}s "
+                f"(pool size {self.size})"
+            )
+        try:
+            conn, created = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["checkout_ms_total"] += elapsed_ms
+            self._stats["checkout_ms_max"] = max(self._stats["checkout_ms_max"], elapsed_ms)
+            self._stats["last_checkout_ms"] = elapsed_ms
+        return conn, created
+
+    def release(self, conn, created, broken=False):
+        try:
+            if broken:
+                self._close(conn)
+            else:
+                self._idle.put((conn, created, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn, created = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            # Roll back whatever the failed statement left open; if even that
+            # fails the connection is unusable and must not go back in the pool.
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, created, broken=broken)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["idle"] = self._idle.qsize()
+        stats["size"] = self.size
+        if stats["checkouts"]:
+            stats["checkout_ms_avg"] = stats["checkout_ms_total"] / stats["checkouts"]
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+
+# Cached once per Streamlit server process, shared by every session/rerun
+@st.cache_resource
+def get_pool():
+    tidb = db_settings()
+    return ConnectionPool(
+        load_db_config(),
+        size=int(tidb.get("pool_size", POOL_SIZE)),
+        timeout=float(tidb.get("pool_timeout", POOL_TIMEOUT)),
+        recycle=float(tidb.get("pool_recycle", POOL_RECYCLE)),
+        max_lifetime=float(tidb.get("pool_max_lifetime", POOL_MAX_LIFETIME)),
+    )
+
+
+# ── Query result cache (TTL + LRU, shared across sessions) ──────────
+# `lab_results`, mydb.lab_results, `mydb`.`lab_results` → lab_results
+TABLE_NAME = r"(?:`?\w+`?\.)?`?(\w+)"
+TABLE_RE = re.compile(rf"\b(?:FROM|JOIN)\s+{TABLE_NAME}", re.IGNORECASE)
+# Write targets only at the start of the statement, so the UPDATE of
+# "ON DUPLICATE KEY UPDATE col = ..." is not taken for a table
+TARGET_RE = re.compile(
+    r"^\s*(?:INSERT(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*\s+INTO"
+    r"|REPLACE(?:\s+(?:LOW_PRIORITY|DELAYED))*(?:\s+INTO)?"
+    rf"|UPDATE(?:\s+(?:LOW_PRIORITY|IGNORE))*)\s+{TABLE_NAME}",
+    re.IGNORECASE,
+)
+WRITE_RE = re.compile(r"^\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+# Schema changes (TRUNCATE, RENAME TABLE, CREATE VIEW, ...) name their
+# tables in too many ways to parse; they clear the whole cache
+DDL_RE = re.compile(r"^\s*(?:ALTER|DROP|TRUNCATE|CREATE|RENAME)\b", re.IGNORECASE)
+
+
+# Reads through a view depend on its base tables, so writes to those
+# invalidate them too
+VIEW_TABLES = {"blood_reports": {"lab_results", "patients", "test_catalog"}}
+
+
+def tables_in(query):
+    target = TARGET_RE.match(query)
+    tables = {t.lower() for t in TABLE_RE.findall(query) + ([target.group(1)] if target else [])}
+    return tables.union(*(VIEW_TABLES.get(t, ()) for t in tables))
+
+
+class QueryCache:
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key → (expires_at, tables, rows)
+        self._generations = {}         # table → writes seen; bumped on invalidation
+        self._epoch = 0                # bumped on clear
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # Whitespace-insensitive SQL + parameters
+    @staticmethod
+    def key(query, params):
+        return " ".join(query.split()).rstrip(";"), tuple(params or ())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[2])
+
+    # Taken before a read runs and handed to put(): a write that lands
+    # while the read is in flight changes it, and the stale rows are dropped
+    def generation(self, tables):
+        with self._lock:
+            return self._generation(tables)
+
+    def _generation(self, tables):
+        return self._epoch, tuple(self._generations.get(t, 0) for t in sorted(tables))
+
+    def put(self, key, tables, rows, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation(tables):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tables, list(rows))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Drop every cached result that read from a table that was just written
+    def invalidate(self, tables):
+        with self._lock:
+            for t in tables:
+                self._generations[t] = self._generations.get(t, 0) + 1
+            stale = [k for k, (_, read, _) in self._entries.items() if read & tables]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "invalidations": self.invalidations,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    tidb = db_settings()
+    return QueryCache(
+        ttl=float(tidb.get("query_cache_ttl", QUERY_CACHE_TTL)),
+        max_entries=int(tidb.get("query_cache_max_entries", QUERY_CACHE_MAX_ENTRIES)),
+    )
+
+
+def _after_write(query):
+    if WRITE_RE.match(query):
+        get_query_cache().invalidate(tables_in(query))
+    elif DDL_RE.match(query):
+        get_query_cache().clear()
+
+
+# ── Helper function to run SQL queries ──────────────────────────────
+# cache=True serves repeated SELECTs from the shared result cache; any
+# write through run_query/execute_many invalidates the tables it touches.
+def run_query(query, params=None, fetch=False, cache=False):
+    with span("db.query") as attrs:
+        if cache and fetch:
+            key = QueryCache.key(query, params)
+            rows = get_query_cache().get(key)
+            attrs["cache"] = "hit" if rows is not None else "miss"
+            if rows is not None:
+                return rows
+            tables = tables_in(query)
+            generation = get_query_cache().generation(tables)
+
+        with get_pool().connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params or ())
+                result = cursor.fetchall() if fetch else None
+                conn.commit()
+            finally:
+                cursor.close()
+        if fetch:
+            attrs["rows"] = len(result)
+
+        if cache and fetch:
+            get_query_cache().put(key, tables, result, generation)
+        _after_write(query)
+        return result
+
+
+# Batched writes: mysql-connector rewrites an INSERT executemany into a
+# single multi-row INSERT; the whole batch is one transaction
+def execute_many(query, seq_params):
+    with span("db.execute_many", rows=len(seq_params)):
+        with get_pool().connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(query, seq_params)
+                conn.commit()
+            finally:
+                cursor.close()
+    _after_write(query)
+    return len(seq_params)
+
+
+# ── Streaming reads (unbuffered cursor) ─────────────────────────────
+# Yields lists of up to batch_size rows without materializing the whole
+# result; the connection is held until the generator is exhausted or closed.
+# Pass a list as `description` to receive the cursor's column descriptions
+# once the query has run (before the first batch).
+def iter_query(query, params=None, batch_size=1000, description=None):
+    pool = get_pool()
+    conn, created = pool.acquire()
+    exhausted = False
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, params or ())
+        if description is not None:
+            description[:] = cursor.description or []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+        exhausted = True
+    finally:
+        # A half-read unbuffered result leaves the connection unusable
+        pool.release(conn, created, broken=not exhausted)
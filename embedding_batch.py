@@ -0,0 +1,69 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+EMBED_BATCH_SIZE = 64   # texts per embeddings request
+EMBED_MAX_WORKERS = 4   # concurrent requests in flight
+EMBED_MAX_RETRIES = 3
+EMBED_BACKOFF = 0.5     # seconds, doubled on each retry
+
+
+# ── Retry with exponential backoff + jitter ─────────────────────────
+def with_retries(fn, *args, retries=EMBED_MAX_RETRIES, backoff=EMBED_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+# ── Batched, bounded-concurrency embedding ──────────────────────────
+# embed_batch takes a list of texts and returns one vector per text, in order
+def embed_in_batches(embed_batch, texts, batch_size=EMBED_BATCH_SIZE,
+                     max_workers=EMBED_MAX_WORKERS, retries=EMBED_MAX_RETRIES,
+                     backoff=EMBED_BACKOFF):
+    texts = list(texts)
+    if not texts:
+        return []
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def run(batch):
+        return with_retries(embed_batch, batch, retries=retries, backoff=backoff)
+
+    if max_workers <= 1 or len(batches) == 1:
+        results = [run(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            results = list(pool.map(run, batches))
+    return [vector for batch in results for vector in batch]
+
+
+# Raw OpenAI-compatible client (openai / groq SDK) as a batch function
+def client_embed_batch(client, model):
+    def embed_batch(batch):
+        response = client.embeddings.create(model=model, input=batch)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+    return embed_batch
+
+
+# ── LangChain wrapper ───────────────────────────────────────────────
+class BatchedEmbeddings(Embeddings):
+    def __init__(self, underlying, batch_size=EMBED_BATCH_SIZE,
+                 max_workers=EMBED_MAX_WORKERS, retries=EMBED_MAX_RETRIES):
+        self.underlying = underlying
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.retries = retries
+
+    def embed_documents(self, texts):
+        return embed_in_batches(
+            self.underlying.embed_documents, texts,
+            batch_size=self.batch_size, max_workers=self.max_workers, retries=self.retries,
+        )
+
+    def embed_query(self, text):
+        return with_retries(self.underlying.embed_query, text, retries=self.retries)
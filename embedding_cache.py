@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+from langchain_core.embeddings import Embeddings
+
+from tracing import span
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache.sqlite")
+CACHE_MAX_ENTRIES = 100_000  # ~150 MB of MiniLM vectors, ~600 MB of OpenAI ones
+
+
+# ── Content-addressed vector store (SQLite, LRU eviction) ───────────
+class EmbeddingCache:
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+            """
+        )
+
+    @staticmethod
+    def key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                found.update(
+                    self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                )
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return {k: np.frombuffer(v, dtype="float32").tolist() for k, v in found.items()}
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, np.asarray(v, dtype="float32").tobytes(), now) for k, v in items.items()],
+            )
+            self._evict()
+            self._db.commit()
+
+    # Drop the least recently used tenth once the cache is over its bound,
+    # so eviction runs rarely rather than on every insert
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + self.max_entries // 10
+        self._db.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,),
+        )
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_embedding_cache():
+    return EmbeddingCache()
+
+
+# ── LangChain wrapper: cache first, model only for misses ───────────
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying, model_name, cache=None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache or get_embedding_cache()
+
+    def _embed(self, texts, namespace, embed_fn):
+        with span(f"embed.{namespace}", texts=len(texts)) as attrs:
+            keys = [self.cache.key(f"{namespace}:{self.model_name}", t) for t in texts]
+            vectors = self.cache.get_many(keys)
+
+            # Only unseen texts go to the model (deduplicated within the batch)
+            missing = {}
+            for k, t in zip(keys, texts):
+                if k not in vectors:
+                    missing.setdefault(k, t)
+            attrs["computed"] = len(missing)
+            if missing:
+                fresh = embed_fn(list(missing.values()))
+                new = dict(zip(missing.keys(), fresh))
+                self.cache.put_many(new)
+                vectors.update(new)
+            return [list(vectors[k]) for k in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "doc", self.underlying.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda ts: [self.underlying.embed_query(ts[0])])[0]
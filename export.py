@@ -0,0 +1,175 @@
+import csv
+import gzip
+import io
+import tempfile
+
+from mysql.connector.constants import FieldType
+
+import db
+
+EXPORT_BATCH_SIZE = 5000
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024  # spill to disk beyond 16 MB
+FILE_CHUNK_SIZE = 1024 * 1024        # bytes per chunk when serving an export
+# Streamlit's download_button holds the whole file in memory; larger
+# exports are served in chunks by the API (GET /records/export)
+PAGE_EXPORT_MAX_ROWS = 200_000
+
+ALL_RECORDS_SQL = "SELECT * FROM blood_reports ORDER BY timestamp DESC, id DESC"
+
+# label → (mime type, file extension)
+FORMATS = {
+    "CSV": ("text/csv", ".csv"),
+    "CSV (gzip)": ("application/gzip", ".csv.gz"),
+    "Parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+def _spool():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="w+b")
+
+
+# pyarrow closes the sink when the writer closes; keep the spool readable
+class _KeepOpen(io.RawIOBase):
+    def __init__(self, f):
+        self._f = f
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self._f.write(b)
+
+    def tell(self):
+        return self._f.tell()
+
+    def flush(self):
+        self._f.flush()
+
+
+# ── CSV (optionally gzip) ───────────────────────────────────────────
+def write_csv(chunks, out, compress=False):
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    writer = None
+    for rows in chunks:
+        if not rows:
+            continue
+        if writer is None:
+            writer = csv.DictWriter(text, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+    if compress:
+        raw.close()  # writes the gzip trailer; leaves `out` open
+
+
+# ── Parquet (one row group per chunk) ───────────────────────────────
+BINARY_CHARSET = 63  # MySQL's "binary" character set (BLOB, VARBINARY)
+
+
+# Arrow schema from the cursor's column types, so a column that is NULL
+# throughout the first chunk still gets its real type. Types without a
+# direct Arrow match (DECIMAL, JSON, BIT, ...) are written as strings.
+def _arrow_schema(description):
+    import pyarrow as pa
+
+    types = {
+        **dict.fromkeys(
+            (FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.INT24, FieldType.LONGLONG, FieldType.YEAR),
+            pa.int64(),
+        ),
+        FieldType.FLOAT: pa.float64(),
+        FieldType.DOUBLE: pa.float64(),
+        FieldType.DATETIME: pa.timestamp("us"),
+        FieldType.TIMESTAMP: pa.timestamp("us"),
+        FieldType.DATE: pa.date32(),
+        FieldType.TIME: pa.duration("us"),
+    }
+    fields = []
+    for column in description:
+        name, type_code = column[0], column[1]
+        charset = column[8] if len(column) > 8 else None
+        if type_code in types:
+            fields.append(pa.field(name, types[type_code]))
+        elif charset == BINARY_CHARSET:
+            fields.append(pa.field(name, pa.binary()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _as_strings(rows, schema):
+    import pyarrow as pa
+
+    columns = [f.name for f in schema if pa.types.is_string(f.type)]
+    for row in rows:
+        for c in columns:
+            value = row.get(c)
+            if value is not None and not isinstance(value, str):
+                row[c] = str(value)
+    return rows
+
+
+# description: cursor.description of the query (see db.iter_query); without
+# it the schema is inferred from the first chunk
+def write_parquet(chunks, out, description=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    for rows in chunks:
+        if not rows:
+            continue
+        if writer is None:
+            if description:
+                schema = _arrow_schema(description)
+            else:
+                # Columns that are all NULL in the first chunk would be typed "null"
+                schema = pa.schema(
+                    [f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                     for f in pa.Table.from_pylist(rows).schema]
+                )
+            writer = pq.ParquetWriter(_KeepOpen(out), schema)
+        writer.write_table(pa.Table.from_pylist(_as_strings(rows, writer.schema), schema=writer.schema))
+    if writer is not None:
+        writer.close()
+    elif description:
+        # No rows: still a valid file with the result's columns
+        pq.write_table(_arrow_schema(description).empty_table(), _KeepOpen(out))
+
+
+# ── Entry points ────────────────────────────────────────────────────
+# Rows flow chunk by chunk from the server-side cursor into the writer,
+# so memory stays bounded by EXPORT_BATCH_SIZE, not by the table size.
+def export_chunks(chunks, fmt="CSV", description=None):
+    out = _spool()
+    if fmt == "Parquet":
+        write_parquet(chunks, out, description)
+    else:
+        write_csv(chunks, out, compress=fmt == "CSV (gzip)")
+    out.seek(0)
+    return out
+
+
+def export_query(query, params=None, fmt="CSV", batch_size=EXPORT_BATCH_SIZE):
+    description = []
+    chunks = db.iter_query(query, params, batch_size=batch_size, description=description)
+    return export_chunks(chunks, fmt, description)
+
+
+# Reads a finished export back in FILE_CHUNK_SIZE pieces and closes it
+def iter_file(f, chunk_size=FILE_CHUNK_SIZE):
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# Whole export as bytes, for downloads up to PAGE_EXPORT_MAX_ROWS
+def export_bytes(query, params=None, fmt="CSV"):
+    with export_query(query, params, fmt) as f:
+        return f.read()
+
+
+def record_count():
+    return db.run_query("SELECT COUNT(*) AS n FROM lab_results", fetch=True, cache=True)[0]["n"]
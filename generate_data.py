@@ -0,0 +1,216 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import abnormal
+import bulk_import
+
+GEN_CHUNK_SIZE = 500_000  # rows generated per vectorized step
+GEN_END = "2025-12-31"    # newest timestamp; fixed so a seed always gives the same rows
+COLUMNS = ["name", "test_name", "result", "unit", "ref_range", "flag", "timestamp"]
+
+# (test_name, unit, ref_range as printed on reports, low, high, decimals)
+# Values are drawn around the middle of low..high; abnormal ones come from
+# per-patient offsets and the distribution tails. low/high only shape the
+# values: flags follow the printed ref_range, so "<200" has no lower bound.
+TEST_CATALOG = [
+    ("Glucose", "mg/dL", "70-110", 70, 110, 0),
+    ("Fasting Glucose", "mg/dL", "70-100", 70, 100, 0),
+    ("HbA1c", "%", "4.0-5.6", 4.0, 5.6, 1),
+    ("Cholesterol", "mg/dL", "<200", 125, 200, 0),
+    ("LDL Cholesterol", "mg/dL", "<100", 50, 100, 0),
+    ("HDL Cholesterol", "mg/dL", ">40", 40, 80, 0),
+    ("Triglycerides", "mg/dL", "<150", 50, 150, 0),
+    ("Hemoglobin", "g/dL", "13.5-17.5", 13.5, 17.5, 1),
+    ("Hematocrit", "%", "41-53", 41, 53, 1),
+    ("Platelet", "10^3/uL", "150-400", 150, 400, 0),
+    ("WBC", "10^3/uL", "4.5-11.0", 4.5, 11.0, 1),
+    ("RBC", "10^6/uL", "4.5-5.9", 4.5, 5.9, 2),
+    ("MCV", "fL", "80-100", 80, 100, 1),
+    ("MCH", "pg", "27-33", 27, 33, 1),
+    ("Neutrophils", "%", "40-70", 40, 70, 1),
+    ("Lymphocytes", "%", "20-40", 20, 40, 1),
+    ("Sodium", "mmol/L", "135-145", 135, 145, 0),
+    ("Potassium", "mmol/L", "3.5 – 5.0", 3.5, 5.0, 1),
+    ("Chloride", "mmol/L", "98-107", 98, 107, 0),
+    ("Calcium", "mg/dL", "8.5-10.5", 8.5, 10.5, 1),
+    ("Creatinine", "mg/dL", "0.6-1.3", 0.6, 1.3, 2),
+    ("BUN", "mg/dL", "7-20", 7, 20, 0),
+    ("eGFR", "mL/min/1.73m2", ">=90", 90, 120, 0),
+    ("ALT", "U/L", "7-56", 7, 56, 0),
+    ("AST", "U/L", "10-40", 10, 40, 0),
+    ("Alkaline Phosphatase", "U/L", "44-147", 44, 147, 0),
+    ("Bilirubin", "mg/dL", "0.1-1.2", 0.1, 1.2, 1),
+    ("Albumin", "g/dL", "3.5-5.0", 3.5, 5.0, 1),
+    ("TSH", "mIU/L", "0.4-4.0", 0.4, 4.0, 2),
+    ("Free T4", "ng/dL", "0.8-1.8", 0.8, 1.8, 2),
+    ("Vitamin D", "ng/mL", "30-100", 30, 100, 0),
+    ("Vitamin B12", "pg/mL", "200-900", 200, 900, 0),
+    ("Ferritin", "ng/mL", "24-336", 24, 336, 0),
+    ("Iron", "ug/dL", "60-170", 60, 170, 0),
+    ("CRP", "mg/L", "<3.0", 0.1, 3.0, 1),
+    ("Uric Acid", "mg/dL", "3.4-7.0", 3.4, 7.0, 1),
+]
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Daniel", "Nancy", "Matthew", "Lisa", "Anthony", "Betty", "Mark", "Margaret", "Steven", "Sandra",
+    "Priya", "Rahul", "Ananya", "Arjun", "Wei", "Mei", "Hiroshi", "Yuki", "Carlos", "Sofia",
+    "Ahmed", "Fatima", "Olusegun", "Amara", "Ivan", "Olga", "Lars", "Ingrid", "Diego", "Lucia",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+    "Sharma", "Patel", "Gupta", "Singh", "Wang", "Li", "Zhang", "Chen", "Tanaka", "Sato",
+    "Khan", "Ali", "Okafor", "Adeyemi", "Ivanov", "Petrov", "Larsen", "Nielsen", "Silva", "Costa",
+]
+
+FLAG_MISSING_RATE = 0.02  # rows exported without a flag (detection falls back to ref_range)
+
+
+# ── Patients ────────────────────────────────────────────────────────
+# First × last combinations, then numbered repeats so every patient id
+# maps to a distinct name ("Mary Smith", ..., "Mary Smith 2", ...)
+def patient_names(ids):
+    ids = np.asarray(ids)
+    combos = len(FIRST_NAMES) * len(LAST_NAMES)
+    first = np.asarray(FIRST_NAMES, dtype=object)[ids % len(FIRST_NAMES)]
+    last = np.asarray(LAST_NAMES, dtype=object)[(ids // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    names = first + " " + last
+    repeat = ids // combos
+    return np.where(repeat > 0, names + " " + (repeat + 1).astype(str).astype(object), names)
+
+
+def patient_name(i):
+    return patient_names([i])[0]
+
+
+# ── Vectorized generation ───────────────────────────────────────────
+# Each chunk has its own RNG stream (seed, chunk number), so output is
+# reproducible for a given seed/chunk size regardless of where it goes.
+def generate(rows, patients=None, seed=42, years=5, end=GEN_END, chunk_size=GEN_CHUNK_SIZE):
+    patients = patients or max(1, rows // 200)
+    end = np.datetime64(end, "s")
+    span = np.int64(years * 365 * 86400)
+
+    catalog = pd.DataFrame(TEST_CATALOG, columns=["test_name", "unit", "ref_range", "low", "high", "decimals"])
+    test_names = catalog["test_name"].to_numpy(dtype=object)
+    units = catalog["unit"].to_numpy(dtype=object)
+    ranges = catalog["ref_range"].to_numpy(dtype=object)
+    low = catalog["low"].to_numpy(dtype=float)
+    high = catalog["high"].to_numpy(dtype=float)
+    scale = 10.0 ** catalog["decimals"].to_numpy()
+    # Bounds as the reports state them (NaN on the open side of "<200")
+    ref_low, ref_high = (bound.to_numpy(dtype=float) for bound in abnormal.parse_ref_range(catalog["ref_range"]))
+
+    # Stable per-patient tendency: most people are healthy, some run high/low
+    patient_rng = np.random.default_rng([seed, 0])
+    patient_bias = patient_rng.normal(0, 0.25, patients) * (patient_rng.random(patients) < 0.3)
+
+    for number, start in enumerate(range(0, rows, chunk_size), start=1):
+        n = min(chunk_size, rows - start)
+        rng = np.random.default_rng([seed, number])
+        person = rng.integers(0, patients, n)
+        test = rng.integers(0, len(TEST_CATALOG), n)
+
+        # Position within the reference range: 0 = low bound, 1 = high bound
+        position = rng.normal(0.5, 0.3, n) + patient_bias[person]
+        value = low[test] + (high[test] - low[test]) * position
+        value = np.round(np.maximum(value, 0) * scale[test]) / scale[test]
+
+        flag = np.select([value > ref_high[test], value < ref_low[test]], ["High", "Low"], "Normal").astype(object)
+        flag[rng.random(n) < FLAG_MISSING_RATE] = ""
+
+        yield pd.DataFrame({
+            "name": patient_names(person),
+            "test_name": test_names[test],
+            "result": value,
+            "unit": units[test],
+            "ref_range": ranges[test],
+            "flag": flag,
+            "timestamp": end - rng.integers(0, span, n).astype("timedelta64[s]"),
+        }, columns=COLUMNS)
+
+
+# ── Sinks ───────────────────────────────────────────────────────────
+# CSV uses the blood_reports column names, so it loads with bulk_import.py
+def write_csv(chunks, path):
+    total = 0
+    for i, df in enumerate(chunks):
+        df.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False,
+                  date_format="%Y-%m-%d %H:%M:%S",
+                  compression="gzip" if path.endswith(".gz") else None)
+        total += len(df)
+    return total
+
+
+def write_parquet(chunks, path):
+    total = 0
+    writer = None
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+            total += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def frame_rows(df):
+    timestamps = df["timestamp"].dt.to_pydatetime().tolist()
+    return zip(*(df[c].tolist() for c in COLUMNS[:-1]), timestamps)
+
+
+# Multi-row INSERT batches on parallel pooled connections (bulk_import.load_rows)
+def load_db(chunks, batch_size=bulk_import.BULK_BATCH_SIZE, workers=bulk_import.BULK_WORKERS, on_progress=None):
+    stats = bulk_import.ImportStats()
+    rows = (row for df in chunks for row in frame_rows(df))
+    return bulk_import.load_rows(rows, stats, batch_size, workers, on_progress)
+
+
+# ── CLI ─────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic blood_reports rows")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--patients", type=int, help="distinct patients (default: rows / 200)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--years", type=float, default=5, help="timestamps spread over this many years")
+    parser.add_argument("--end", default=GEN_END, help="newest timestamp (YYYY-MM-DD)")
+    parser.add_argument("--chunk-size", type=int, default=GEN_CHUNK_SIZE)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="output file: .csv, .csv.gz or .parquet")
+    target.add_argument("--db", action="store_true", help="insert into blood_reports (st.secrets [tidb])")
+    parser.add_argument("--batch-size", type=int, default=bulk_import.BULK_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=bulk_import.BULK_WORKERS)
+    parser.add_argument("--no-index", action="store_true", help="skip the vector index sync after --db")
+    args = parser.parse_args()
+
+    chunks = generate(args.rows, args.patients, args.seed, args.years, args.end, args.chunk_size)
+    start = time.perf_counter()
+    if args.db:
+        stats = load_db(
+            chunks, args.batch_size, args.workers,
+            on_progress=lambda s: print(f"\r{s.summary()}", end="", flush=True),
+        )
+        print(f"\r{stats.summary()}")
+        if not args.no_index and stats.loaded:
+            print(f"Vector index: {bulk_import.sync_vector_index()} new row(s) embedded")
+    else:
+        writer = write_parquet if args.out.endswith(".parquet") else write_csv
+        total = writer(chunks, args.out)
+        seconds = time.perf_counter() - start
+        print(f"{total} rows written to {args.out} in {seconds:.1f}s ({total / seconds:,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from answer_cache import get_answer_cache
+from async_core import load_rag_resources, run_sync
+from context_builder import doc_report_ids
+from rag import ANALYSIS_QUERY, SYSTEM_PROMPT, abnormal_context, build_answer_chain, model_id
+from tracing import span, trace
+
+JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jobs.sqlite")
+JOB_WORKERS = 2  # analyses running at once (LLM calls overlap; embedding is serialized)
+
+# One torch model serves every job: queue behind it rather than
+# oversubscribing the CPU with concurrent encodes
+EMBEDDING_LOCK = threading.Lock()
+
+
+# ── Job handlers ────────────────────────────────────────────────────
+def run_rag_analysis(filters, query=ANALYSIS_QUERY):
+    with trace("rag.job") as job_trace:
+        index, tokenizer, llm = run_sync(load_rag_resources())
+        with EMBEDDING_LOCK:
+            index.sync()
+            docs, counts, packing = abnormal_context(index, filters, query, tokenizer=tokenizer)
+
+        answer_cache = get_answer_cache()
+        cache_key = answer_cache.key(model_id(llm), SYSTEM_PROMPT, docs, query)
+        answer = answer_cache.get(cache_key)
+        cached = answer is not None
+        if not cached:
+            with span("llm.invoke"):
+                answer = build_answer_chain(llm).invoke({"input": query, "context": docs})
+            answer_cache.put(cache_key, answer, doc_report_ids(docs))
+
+    return {
+        "answer": answer,
+        "cached": cached,
+        "rows": counts["rows"],
+        "abnormal": counts["abnormal"],
+        "packing": packing,
+        "timings": job_trace.table(),
+    }
+
+
+HANDLERS = {
+    "rag_analysis": run_rag_analysis,
+}
+
+
+# ── Persistent job queue ────────────────────────────────────────────
+# Jobs are recorded in SQLite so the page can poll them across reruns and
+# sessions; a thread pool runs them off the Streamlit script thread.
+class JobQueue:
+    def __init__(self, path=JOBS_PATH, workers=JOB_WORKERS, handlers=HANDLERS):
+        self.handlers = handlers
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                label TEXT,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            """
+        )
+        # Files created before jobs recorded their owning process
+        if "owner" not in {r[1] for r in self._db.execute("PRAGMA table_info(jobs)")}:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+            self._db.commit()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._recover()
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._db.commit()
+
+    # The Streamlit apps and api.py share this file. Only jobs whose owning
+    # process has died are touched: its running jobs are lost, its queued
+    # ones are adopted and picked up again.
+    def _recover(self):
+        with self._lock:
+            owners = {r[0] for r in self._db.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN ('queued', 'running')"
+            )}
+            dead = [owner for owner in owners if not _alive(owner)]
+            queued = []
+            for owner in dead:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'interrupted by server restart', "
+                    "finished_at = ? WHERE status = 'running' AND owner IS ?",
+                    (time.time(), owner),
+                )
+                queued += [r[0] for r in self._db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND owner IS ? ORDER BY created_at", (owner,)
+                )]
+                self._db.execute(
+                    "UPDATE jobs SET owner = ? WHERE status = 'queued' AND owner IS ?", (os.getpid(), owner)
+                )
+            self._db.commit()
+        for job_id in queued:
+            self._executor.submit(self._run, job_id)
+
+    def submit(self, kind, params, label=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, params, label, status, created_at, owner) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params, default=str), label, time.time(), os.getpid()),
+            )
+            self._db.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    # Claimed with a single conditional UPDATE, so a job runs at most once
+    # even if two processes try to start it
+    def _claim(self, job_id):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), os.getpid(), job_id),
+            )
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    def _run(self, job_id):
+        if not self._claim(job_id):
+            return
+        job = self.get(job_id)
+        try:
+            result = self.handlers[job["kind"]](**job["params"])
+            self._update(job_id, status="done", result=json.dumps(result, default=str), finished_at=time.time())
+        except Exception as e:
+            self._update(
+                job_id, status="failed", error=f"{e}\n{traceback.format_exc()}", finished_at=time.time()
+            )
+
+    def get(self, job_id):
+        return (self.list([job_id]) or [None])[0]
+
+    def list(self, job_ids):
+        if not job_ids:
+            return []
+        placeholders = ", ".join("?" * len(job_ids))
+        with self._lock:
+            cursor = self._db.execute(
+                f"SELECT * FROM jobs WHERE id IN ({placeholders}) ORDER BY created_at DESC", list(job_ids)
+            )
+            columns = [c[0] for c in cursor.description]
+            rows = [dict(zip(columns, r)) for r in cursor.fetchall()]
+        for row in rows:
+            row["params"] = json.loads(row["params"])
+            row["result"] = json.loads(row["result"]) if row["result"] else None
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def _alive(pid):
+    if pid is None:
+        return False  # recorded before owners were
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
@@ -0,0 +1,127 @@
+import re
+
+import streamlit as st
+
+from db import run_query
+from records import RESULT_COLUMNS, expand, fetch_reports, test_catalog
+
+# canonical test → words people use for it in questions
+SYNONYMS = {
+    "glucose": ["sugar", "blood sugar", "fbs", "fasting sugar", "glycemia"],
+    "hba1c": ["a1c", "glycated hemoglobin", "glycosylated hemoglobin"],
+    "cholesterol": ["chol", "lipids", "lipid profile", "lipid panel"],
+    "ldl cholesterol": ["ldl", "bad cholesterol"],
+    "hdl cholesterol": ["hdl", "good cholesterol"],
+    "triglycerides": ["tg", "trigs"],
+    "hemoglobin": ["hb", "hgb", "haemoglobin"],
+    "hematocrit": ["hct", "haematocrit", "pcv"],
+    "platelet": ["plt", "thrombocytes", "platelet count"],
+    "wbc": ["white blood cells", "white cells", "leukocytes", "leucocytes", "white count"],
+    "rbc": ["red blood cells", "red cells", "erythrocytes"],
+    "creatinine": ["creat", "kidney function"],
+    "egfr": ["gfr", "filtration rate"],
+    "alt": ["sgpt", "alanine aminotransferase"],
+    "ast": ["sgot", "aspartate aminotransferase"],
+    "tsh": ["thyroid", "thyroid stimulating hormone"],
+    "vitamin d": ["vit d", "25 oh d", "calcidiol"],
+    "vitamin b12": ["b12", "vit b12", "cobalamin"],
+    "ferritin": ["iron stores"],
+    "crp": ["c reactive protein", "inflammation"],
+}
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def words(text):
+    return tuple(_stem(w) for w in WORD_RE.findall(text.lower()))
+
+
+def _contains(seq, sub):
+    return any(seq[i:i + len(sub)] == sub for i in range(len(seq) - len(sub) + 1))
+
+
+# ── Word trie over test names and synonyms ──────────────────────────
+# Each phrase (a stored test name, a canonical name or an alias) maps to
+# the stored test names containing the canonical words – "cholesterol"
+# resolves to Cholesterol, LDL Cholesterol and HDL Cholesterol, like the
+# old LIKE '%cholesterol%'. A question is matched in one left-to-right
+# pass, taking the longest phrase at each position.
+class TestNameResolver:
+    def __init__(self, test_names, synonyms=SYNONYMS):
+        self.test_names = sorted(test_names)
+        self._trie = {}
+        stored = {words(name): name for name in self.test_names}
+
+        phrases = {key: key for key in stored}
+        for canonical, aliases in synonyms.items():
+            canonical_words = words(canonical)
+            phrases.setdefault(canonical_words, canonical_words)
+            for alias in aliases:
+                phrases.setdefault(words(alias), canonical_words)
+
+        for phrase, canonical_words in phrases.items():
+            targets = {name for key, name in stored.items() if _contains(key, canonical_words)}
+            if phrase and targets:
+                node = self._trie
+                for word in phrase:
+                    node = node.setdefault(word, {})
+                node.setdefault(None, set()).update(targets)
+
+    def match(self, question):
+        tokens = words(question)
+        found = set()
+        i = 0
+        while i < len(tokens):
+            node, end, targets = self._trie, None, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    end, targets = j + 1, node[None]
+            if targets:
+                found |= targets
+                i = end
+            else:
+                i += 1
+        return sorted(found)
+
+
+@st.cache_resource(max_entries=4)
+def _resolver(test_names):
+    return TestNameResolver(test_names)
+
+
+# Test names come from the small test_catalog table, which sits in the
+# query cache until a new test is added
+def get_resolver():
+    return _resolver(tuple(sorted({t["test_name"] for t in test_catalog().values()})))
+
+
+# ── Latest results per test ─────────────────────────────────────────
+# One branch per test_catalog entry of the matched tests (a test can be
+# stored with several units), each a backward range read of
+# (test_id, timestamp) stopping after `limit` rows, so the cost doesn't
+# grow with the table.
+def latest_results(test_names, limit=50):
+    if not test_names:
+        return fetch_reports("ORDER BY r.timestamp DESC, r.id DESC LIMIT %s", (limit,), cache=True)
+    wanted = set(test_names)
+    test_ids = [i for i, t in test_catalog().items() if t["test_name"] in wanted]
+    if not test_ids:
+        return []
+    branch = f"(SELECT {RESULT_COLUMNS} FROM lab_results r WHERE r.test_id = %s ORDER BY r.timestamp DESC LIMIT %s)"
+    params = []
+    for test_id in test_ids:
+        params += [test_id, limit]
+    rows = run_query(
+        " UNION ALL ".join([branch] * len(test_ids)) + " ORDER BY timestamp DESC LIMIT %s",
+        (*params, limit),
+        fetch=True,
+        cache=True,
+    )
+    return expand(rows or [])
@@ -0,0 +1,297 @@
+import argparse
+from datetime import datetime
+
+from db import run_query
+
+NORMALIZE_BATCH_SIZE = 50_000  # blood_reports ids copied per backfill statement
+
+# Composite indexes matching the apps' access paths, on the normalized
+# tables behind the blood_reports view (migration 4):
+#   patient = name AND timestamp range ORDER BY timestamp   (app.py search)
+#   test filters + ORDER BY timestamp                       (app4.py, app6.py)
+#   ORDER BY timestamp DESC, id DESC keyset pages           (Show All Records)
+REQUIRED_INDEXES = {
+    "lab_results": {
+        "idx_lab_results_patient_ts": ("patient_id", "timestamp"),
+        "idx_lab_results_test_ts": ("test_id", "timestamp"),
+        "idx_lab_results_ts_id": ("timestamp", "id"),
+    },
+    "patients": {"uq_patients_name": ("name",)},
+    "test_catalog": {"uq_test_catalog": ("test_name", "unit", "ref_range")},
+}
+
+# Migration 2's indexes on the original blood_reports table
+BLOOD_REPORTS_INDEXES = {
+    "idx_blood_reports_name_ts": ("name", "timestamp"),
+    "idx_blood_reports_test_ts": ("test_name", "timestamp"),
+    "idx_blood_reports_ts_id": ("timestamp", "id"),
+}
+
+
+# ── Introspection ───────────────────────────────────────────────────
+def existing_indexes(table):
+    rows = run_query(
+        """
+        -- aliases keep the keys lowercase on MySQL 8
+        SELECT index_name AS index_name, column_name AS column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index
+        """,
+        (table,),
+        fetch=True,
+    ) or []
+    indexes = {}
+    for r in rows:
+        indexes.setdefault(r["index_name"], []).append(r["column_name"].lower())
+    return {name: tuple(cols) for name, cols in indexes.items()}
+
+
+def table_type(table):
+    rows = run_query(
+        """
+        SELECT table_type AS table_type FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+        """,
+        (table,),
+        fetch=True,
+    )
+    return rows[0]["table_type"] if rows else None
+
+
+# An index covers the access path if it starts with the same columns
+def has_index(table, columns, indexes=None):
+    indexes = existing_indexes(table) if indexes is None else indexes
+    return any(cols[:len(columns)] == tuple(columns) for cols in indexes.values())
+
+
+def ensure_index(table, name, columns):
+    if not has_index(table, columns):
+        run_query(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+
+def missing_indexes():
+    missing = []
+    for table, wanted in REQUIRED_INDEXES.items():
+        indexes = existing_indexes(table)
+        for name, columns in wanted.items():
+            if not has_index(table, columns, indexes):
+                missing.append((table, name, columns))
+    return missing
+
+
+# ── Migrations ──────────────────────────────────────────────────────
+def m001_create_blood_reports():
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS blood_reports (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            timestamp DATETIME NOT NULL,
+            test_name VARCHAR(255) NOT NULL,
+            result DOUBLE,
+            unit VARCHAR(50),
+            ref_range VARCHAR(100),
+            flag VARCHAR(50)
+        )
+        """
+    )
+
+
+def m002_blood_reports_indexes():
+    for name, columns in BLOOD_REPORTS_INDEXES.items():
+        ensure_index("blood_reports", name, columns)
+
+
+# Per-patient summaries written by batch_report.py; context_hash lets the
+# nightly run skip patients whose rows haven't changed
+def m003_create_report_summaries():
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS report_summaries (
+            name VARCHAR(255) PRIMARY KEY,
+            summary TEXT NOT NULL,
+            results INT NOT NULL,
+            abnormal INT NOT NULL,
+            model VARCHAR(100),
+            context_hash CHAR(64),
+            generated_at DATETIME
+        )
+        """
+    )
+
+
+# blood_reports repeated the patient name, test name, unit and reference
+# range as strings on every row. They move to patients / test_catalog with
+# integer keys, results to lab_results, and blood_reports becomes a view
+# with the old columns so existing reads keep working.
+def m004_normalize_blood_reports():
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS patients (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            UNIQUE KEY uq_patients_name (name)
+        )
+        """
+    )
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS test_catalog (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            test_name VARCHAR(255) NOT NULL,
+            unit VARCHAR(50) NOT NULL DEFAULT '',
+            ref_range VARCHAR(100) NOT NULL DEFAULT '',
+            UNIQUE KEY uq_test_catalog (test_name, unit, ref_range)
+        )
+        """
+    )
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            patient_id INT NOT NULL,
+            test_id INT NOT NULL,
+            result DOUBLE,
+            flag VARCHAR(50),
+            timestamp DATETIME NOT NULL,
+            KEY idx_lab_results_patient_ts (patient_id, timestamp),
+            KEY idx_lab_results_test_ts (test_id, timestamp),
+            KEY idx_lab_results_ts_id (timestamp, id)
+        )
+        """
+    )
+    # Safe to re-run: an interrupted migration resumes where it stopped
+    if table_type("blood_reports") == "BASE TABLE":
+        copied = backfill("blood_reports")
+        run_query("RENAME TABLE blood_reports TO blood_reports_legacy")
+        # Rows written between the last batch and the rename
+        backfill("blood_reports_legacy", copied)
+    run_query(
+        """
+        CREATE OR REPLACE VIEW blood_reports AS
+        SELECT r.id, p.name, r.timestamp, t.test_name, r.result, t.unit, t.ref_range, r.flag
+        FROM lab_results r
+        JOIN patients p ON p.id = r.patient_id
+        JOIN test_catalog t ON t.id = r.test_id
+        """
+    )
+
+
+# Copies source rows with id > after_id in id ranges, keeping their ids;
+# each range is a few bounded statements rather than one huge transaction
+def backfill(source, after_id=0, batch_size=NORMALIZE_BATCH_SIZE):
+    last_id = run_query(f"SELECT MAX(id) AS id FROM {source}", fetch=True)[0]["id"] or 0
+    for low in range(after_id, last_id, batch_size):
+        ids = (low, min(low + batch_size, last_id))
+        run_query(
+            f"INSERT IGNORE INTO patients (name) SELECT DISTINCT name FROM {source} WHERE id > %s AND id <= %s",
+            ids,
+        )
+        run_query(
+            f"""
+            INSERT IGNORE INTO test_catalog (test_name, unit, ref_range)
+            SELECT DISTINCT test_name, COALESCE(unit, ''), COALESCE(ref_range, '')
+            FROM {source} WHERE id > %s AND id <= %s
+            """,
+            ids,
+        )
+        run_query(
+            f"""
+            INSERT IGNORE INTO lab_results (id, patient_id, test_id, result, flag, timestamp)
+            SELECT b.id, p.id, t.id, b.result, b.flag, b.timestamp
+            FROM {source} b
+            JOIN patients p ON p.name = b.name
+            JOIN test_catalog t ON t.test_name = b.test_name
+                AND t.unit = COALESCE(b.unit, '') AND t.ref_range = COALESCE(b.ref_range, '')
+            WHERE b.id > %s AND b.id <= %s
+            """,
+            ids,
+        )
+    return max(after_id, last_id)
+
+
+# (version, description, function) – append only, never renumber
+MIGRATIONS = [
+    (1, "create blood_reports", m001_create_blood_reports),
+    (2, "composite indexes for search and pagination", m002_blood_reports_indexes),
+    (3, "create report_summaries", m003_create_report_summaries),
+    (4, "patients / test_catalog / lab_results behind a blood_reports view", m004_normalize_blood_reports),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version():
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at DATETIME
+        )
+        """
+    )
+    rows = run_query("SELECT MAX(version) AS version FROM schema_migrations", fetch=True)
+    return (rows[0]["version"] if rows else None) or 0
+
+
+def migrate(log=print):
+    version = current_version()
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        log(f"Applying migration {number}: {description}")
+        apply()
+        run_query(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+            (number, description, datetime.now()),
+        )
+    return current_version()
+
+
+# ── Startup check ───────────────────────────────────────────────────
+def schema_warnings():
+    warnings = []
+    version = current_version()
+    if version < LATEST_VERSION:
+        warnings.append(
+            f"Database schema is at version {version}, latest is {LATEST_VERSION}. "
+            "Run `python migrations.py` to upgrade."
+        )
+        # The indexes below only exist once the schema is current
+        return warnings
+    for table, name, columns in missing_indexes():
+        warnings.append(
+            f"Missing index on {table} ({', '.join(columns)}) – queries on it will "
+            f"scan the whole table. Expected `{name}`."
+        )
+    return warnings
+
+
+def explain(query, params=None):
+    return run_query(f"EXPLAIN {query}", params, fetch=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or check blood_reports schema migrations")
+    parser.add_argument("--check", action="store_true", help="only report schema problems")
+    args = parser.parse_args()
+
+    if args.check:
+        for warning in schema_warnings() or ["Schema is up to date."]:
+            print(warning)
+        # The patient search should show a uq_patients_name lookup followed by
+        # a range scan on idx_lab_results_patient_ts
+        for row in explain(
+            "SELECT * FROM blood_reports WHERE name = %s AND timestamp >= %s AND timestamp < %s "
+            "ORDER BY timestamp DESC",
+            ("probe", "2000-01-01", "2100-01-01"),
+        ) or []:
+            print(row)
+    else:
+        print(f"Schema at version {migrate()}")
+
+
+if __name__ == "__main__":
+    main()
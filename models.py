@@ -0,0 +1,127 @@
+import threading
+import time
+
+import streamlit as st
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_groq import ChatGroq
+
+from answer_cache import get_answer_cache
+from embedding_batch import BatchedEmbeddings
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from tracing import span
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+# ── Resource registry ───────────────────────────────────────────────
+# Heavy objects (torch weights, tokenizers, API clients) are loaded once
+# per server process and shared by every session and rerun.
+class ResourceRegistry:
+    def __init__(self):
+        self._resources = {}
+        self._locks = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._warm_thread = None
+
+    def get(self, key, loader):
+        if key in self._resources:
+            self._metrics[key]["hits"] += 1
+            return self._resources[key]
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        # Per-key lock: a second caller waits for the first load instead of
+        # loading the same model twice
+        with span("model.load", key=key), key_lock:
+            if key not in self._resources:
+                start = time.perf_counter()
+                resource = loader()
+                self._metrics[key] = {
+                    "load_s": round(time.perf_counter() - start, 3),
+                    "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "thread": threading.current_thread().name,
+                    "hits": 0,
+                }
+                self._resources[key] = resource
+            else:
+                self._metrics[key]["hits"] += 1
+        return self._resources[key]
+
+    def warm(self, loaders, background=True):
+        def run():
+            for load in loaders:
+                try:
+                    load()
+                except Exception as e:
+                    with self._lock:
+                        self._metrics[f"warmup:{getattr(load, '__name__', load)}"] = {"error": str(e)}
+
+        if not background:
+            run()
+            return None
+        with self._lock:
+            if self._warm_thread is None:
+                self._warm_thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+                self._warm_thread.start()
+        return self._warm_thread
+
+    def metrics(self):
+        with self._lock:
+            return {key: dict(value) for key, value in self._metrics.items()}
+
+
+@st.cache_resource
+def get_registry():
+    return ResourceRegistry()
+
+
+# ── Cached models and clients ───────────────────────────────────────
+def _hf_model(model_name):
+    return get_registry().get(
+        f"hf:{model_name}",
+        lambda: HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"normalize_embeddings": True},
+        ),
+    )
+
+
+# Wrapped in the content-addressed cache so unchanged rows are never re-embedded;
+# sequential batches since torch already uses every core
+def get_embeddings(model_name=EMBED_MODEL):
+    return get_registry().get(
+        f"embeddings:{model_name}",
+        lambda: CachedEmbeddings(BatchedEmbeddings(_hf_model(model_name), max_workers=1), model_name),
+    )
+
+
+# The tokenizer ships with the sentence-transformers model, so reuse it
+def get_tokenizer(model_name=EMBED_MODEL):
+    return get_registry().get(f"tokenizer:{model_name}", lambda: _hf_model(model_name).client.tokenizer)
+
+
+def get_llm(model=GROQ_MODEL, temperature=0.3):
+    return get_registry().get(
+        f"groq:{model}:{temperature}",
+        lambda: ChatGroq(
+            model=model,
+            temperature=temperature,
+            groq_api_key=st.secrets["groq"]["api_key"],
+        ),
+    )
+
+
+# Start loading in a background thread so the first RAG click doesn't pay for it
+def warm_up(background=True):
+    return get_registry().warm([get_embeddings, get_tokenizer, get_llm], background=background)
+
+
+def model_metrics():
+    metrics = get_registry().metrics()
+    metrics["embedding_cache"] = get_embedding_cache().stats()
+    metrics["answer_cache"] = get_answer_cache().stats()
+    return metrics
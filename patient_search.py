@@ -0,0 +1,194 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+import streamlit as st
+
+from db import run_query
+
+NAME_MATCH_LIMIT = 10
+NAME_MIN_SCORE = 0.35   # trigram similarity below this is noise
+PREFIX_SCORE = 0.85     # every typed word starts a word of the name
+PHONETIC_SCORE = 0.7    # every typed word sounds like a word of the name
+NAME_ID_LAG = 50_000    # ids below last_id re-read when patients committed out of order
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+
+# ── Normalized keys ─────────────────────────────────────────────────
+# "  José  O'Brien " → "jose obrien"
+def normalize(name):
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    return " ".join(re.sub(r"[^a-z0-9 ]+", "", text).split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# American Soundex: "robert" / "rupert" → R163
+def soundex(word):
+    word = re.sub(r"[^a-z]", "", word.lower())
+    if not word:
+        return ""
+    code, last = word[0].upper(), SOUNDEX_CODES.get(word[0])
+    for ch in word[1:]:
+        digit = SOUNDEX_CODES.get(ch)
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":
+            last = digit
+    return code.ljust(4, "0")
+
+
+def _starts(typed, word):
+    return word.startswith(typed)
+
+
+def _same(typed, word):
+    return typed == word
+
+
+# ── In-memory patient name index ────────────────────────────────────
+# Built from the patients table and extended as patients are added:
+# trigram postings for typo-tolerant matches, sorted words for prefix
+# matches and Soundex codes for phonetic ones. Lookups touch only the postings of the typed
+# text, never the whole name list.
+class NameIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}                     # name → normalized key
+        self._sizes = {}                     # name → trigram count
+        self._grams = defaultdict(set)       # trigram → names
+        self._sounds = defaultdict(set)      # soundex → names
+        self._words = []                     # sorted (word, name)
+        self.last_id = 0                     # highest patients.id indexed
+
+    def __len__(self):
+        return len(self._names)
+
+    def _add(self, name, keep_sorted=True):
+        key = normalize(name)
+        self._names[name] = key
+        grams = trigrams(key)
+        self._sizes[name] = len(grams)
+        for gram in grams:
+            self._grams[gram].add(name)
+        for word in key.split():
+            self._sounds[soundex(word)].add(name)
+            if keep_sorted:
+                bisect.insort(self._words, (word, name))
+            else:
+                self._words.append((word, name))
+
+    # rows: patients (id, name); names already indexed are skipped.
+    # Patients are never renamed or deleted (only their lab_results are)
+    def add(self, rows):
+        with self._lock:
+            added = [r for r in rows if r["name"] not in self._names]
+            # Initial build: one sort instead of many insorts
+            bulk = len(added) > 1000
+            for r in added:
+                self._add(r["name"], keep_sorted=not bulk)
+            if bulk:
+                self._words.sort()
+            self.last_id = max([self.last_id, *(r["id"] for r in rows)])
+        return len(added)
+
+    def _prefixed(self, word):
+        start = bisect.bisect_left(self._words, (word, ""))
+        found = set()
+        for w, name in self._words[start:]:
+            if not w.startswith(word):
+                break
+            found.add(name)
+        return found
+
+    # Each typed word must match a different word of the name ("jo jo" is
+    # not "Jon Dow"). Matching sets are nested (prefixes) or disjoint
+    # (Soundex codes), so taking the most specific typed word first is exact.
+    @staticmethod
+    def _covers(typed, name_words, matches):
+        free = list(name_words)
+        for t in sorted(typed, key=len, reverse=True):
+            hit = next((w for w in free if matches(t, w)), None)
+            if hit is None:
+                return False
+            free.remove(hit)
+        return True
+
+    # → [(name, score, how)], best first
+    def search(self, query, limit=NAME_MATCH_LIMIT, min_score=NAME_MIN_SCORE):
+        key = normalize(query)
+        if not key:
+            return []
+        words = key.split()
+        grams = trigrams(key)
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._grams.get(gram, ()))
+            similarity = {
+                name: 2 * count / (len(grams) + self._sizes[name])
+                for name, count in shared.items()
+            }
+            matches = {name: (sim, "similar") for name, sim in similarity.items() if sim >= min_score}
+
+            prefixed = set.intersection(*(self._prefixed(w) for w in words))
+            codes = [soundex(w) for w in words]
+            sounds = set.intersection(*(self._sounds.get(c, set()) for c in codes)) if all(codes) else set()
+            for name in prefixed | sounds:
+                name_words = self._names[name].split()
+                sim = similarity.get(name, 0.0)
+                if name in prefixed and self._covers(words, name_words, _starts):
+                    score, how = PREFIX_SCORE + 0.15 * len(key) / len(self._names[name]), "prefix"
+                elif name in sounds and self._covers(codes, [soundex(w) for w in name_words], _same):
+                    # Closer spellings of a sound-alike rank first
+                    score, how = PHONETIC_SCORE + 0.15 * sim, "sounds like"
+                else:
+                    continue
+                if score > matches.get(name, (0.0, ""))[0]:
+                    matches[name] = (score, how)
+
+            for name in matches:
+                if self._names[name] == key:
+                    matches[name] = (1.0, "exact")
+
+        ranked = sorted(matches.items(), key=lambda m: (-m[1][0], -similarity.get(m[0], 0.0), m[0]))
+        return [(name, round(score, 3), how) for name, (score, how) in ranked[:limit]]
+
+
+@st.cache_resource
+def _name_index():
+    return NameIndex()
+
+
+def _patients_after(after_id):
+    return run_query("SELECT id, name FROM patients WHERE id > %s ORDER BY id", (after_id,), fetch=True) or []
+
+
+# The patient count is cached until the next write to patients, so most
+# searches don't touch the database. When it runs ahead of the index, the
+# patients added since the last sync are read. Ids can commit out of order
+# (parallel bulk loads, TiDB's per-server AUTO_INCREMENT), so a count still
+# short after that re-reads the last NAME_ID_LAG ids, then everything.
+def get_name_index():
+    index = _name_index()
+    count = run_query("SELECT COUNT(*) AS n FROM patients", fetch=True, cache=True)[0]["n"]
+    for after_id in (index.last_id, max(0, index.last_id - NAME_ID_LAG), 0):
+        if len(index) >= count:
+            break
+        index.add(_patients_after(after_id))
+    return index
+
+
+def search_patients(query, limit=NAME_MATCH_LIMIT):
+    return get_name_index().search(query, limit)
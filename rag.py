@@ -0,0 +1,87 @@
+import time
+
+from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.prompts import ChatPromptTemplate
+
+import abnormal
+from context_builder import CONTEXT_TOKEN_BUDGET, pack_rows
+from tracing import record_span, span
+
+# Updated prompt with medicine suggestions
+SYSTEM_PROMPT = """You are a helpful educational assistant summarizing blood test results.
+Use ONLY the provided report excerpts below.
+Your response MUST include:
+
+1. Identification of clearly abnormal values (where flag is 'High'/'Low' or result is outside ref range).
+2. For EACH abnormal test: very brief general interpretation.
+3. For EACH abnormal test: common lifestyle recommendations (diet, exercise, habits) AND typical/commonly associated medicines, supplements or treatments (e.g. statins for high cholesterol, iron for low hemoglobin, vitamin D for deficiency, etc.).
+
+VERY IMPORTANT – ALWAYS INCLUDE THIS EXACT DISCLAIMER AT  END OF YOUR RESPONSE:
+"THIS IS GENERAL EDUCATIONAL INFORMATION ONLY – NOT MEDICAL ADVICE, NOT A DIAGNOSIS, NOT A TREATMENT PLAN. 
+DO NOT TAKE ANY MEDICATION OR SUPPLEMENT BASED ON THIS OUTPUT. 
+CONSULT A QUALIFIED DOCTOR FOR PERSONALIZED INTERPRETATION, DIAGNOSIS AND PRESCRIPTION."
+
+Never recommend specific doses, brands or starting/stopping medicines.
+Keep response clear, structured and concise.
+
+Context (blood reports):
+{context}"""
+
+MAX_CANDIDATE_ROWS = 200  # abnormal rows ranked for packing; the budget decides how many fit
+
+ANALYSIS_QUERY = "Identify abnormal blood test results, explain briefly, list common general recommendations and typical medicines/supplements for each abnormal parameter."
+
+
+# ── Context ─────────────────────────────────────────────────────────
+# Out-of-range detection is done at index time rather than by the model:
+# only the abnormal rows (most relevant first) plus a per-test summary are
+# sent, packed into compact per-patient/per-test tables within a token
+# budget. Returns the docs, {"rows", "abnormal"} counts of the filtered
+# rows and the packing info.
+def abnormal_context(index, filters, query, tokenizer=None, budget=CONTEXT_TOKEN_BUDGET):
+    filters = filters or {}
+    with span("rag.context") as attrs:
+        summary = index.test_summary(filters)
+        counts = {"rows": int(summary["results"].sum()), "abnormal": int(summary["abnormal"].sum())}
+        ranked = (
+            index.similarity_search(query, k=MAX_CANDIDATE_ROWS, filters={**filters, "abnormal": True})
+            if counts["abnormal"] else []
+        )
+        rows = index.rows(d.metadata["id"] for d in ranked)
+
+        with span("rag.pack") as pack_attrs:
+            docs, info = pack_rows(rows, budget=budget, tokenizer=tokenizer, preamble=abnormal.summary_text(summary))
+            pack_attrs["tokens"] = info["tokens"]
+        attrs["abnormal"] = counts["abnormal"]
+    return docs, counts, info
+
+
+# ── Chain ───────────────────────────────────────────────────────────
+# Retrieval happens separately (see the apps) so the retrieved documents
+# can key the answer cache before the LLM is called.
+def build_answer_chain(llm, system_prompt=SYSTEM_PROMPT):
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", system_prompt), ("human", "{input}")]
+    )
+    return create_stuff_documents_chain(llm, prompt)
+
+
+def model_id(llm):
+    return f"{getattr(llm, 'model_name', type(llm).__name__)}:{getattr(llm, 'temperature', '')}"
+
+
+# ── Streaming ───────────────────────────────────────────────────────
+# Yields answer tokens as Groq produces them (for st.write_stream) and
+# records time-to-first-token / total seconds. Timed with record_span, not
+# `with span(...)`, because callers may advance it from different threads.
+def stream_answer(answer_chain, query, docs, timings):
+    start = time.perf_counter()
+    attrs = {}
+    for token in answer_chain.stream({"input": query, "context": docs}):
+        if token:
+            if "first_token_s" not in timings:
+                timings["first_token_s"] = time.perf_counter() - start
+                attrs["first_token_ms"] = round(timings["first_token_s"] * 1000)
+            yield token
+    timings["total_s"] = time.perf_counter() - start
+    record_span("llm.stream", start, **attrs)
@@ -0,0 +1,241 @@
+import threading
+import time
+
+import mysql.connector
+import streamlit as st
+
+import db
+
+KEY_CACHE_MAX_ENTRIES = 200_000  # ids remembered per key table and process
+KEY_INSERT_RETRIES = 3           # attempts after a deadlock on the key tables
+DEADLOCK_ERRNO = 1213            # ER_LOCK_DEADLOCK (MySQL and TiDB)
+
+# Natural key of each lookup table (both have UNIQUE indexes on it)
+KEY_COLUMNS = {
+    "patients": ("name",),
+    "test_catalog": ("test_name", "unit", "ref_range"),
+}
+
+LAB_RESULTS_SQL = """
+    INSERT INTO lab_results
+    (patient_id, test_id, result, flag, timestamp)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+LAB_RESULTS_WITH_ID_SQL = """
+    INSERT INTO lab_results
+    (id, patient_id, test_id, result, flag, timestamp)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+RESULT_COLUMNS = "r.id, r.patient_id, r.test_id, r.result, r.flag, r.timestamp"
+
+
+# ── Integer keys ────────────────────────────────────────────────────
+# name → patients.id and (test_name, unit, ref_range) → test_catalog.id,
+# created on first use and remembered, so steady-state inserts only write
+# lab_results
+class KeyCache:
+    def __init__(self, max_entries=KEY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def lookup(self, keys):
+        with self._lock:
+            return {k: self._values[k] for k in keys if k in self._values}
+
+    def store(self, values):
+        with self._lock:
+            if len(self._values) + len(values) > self.max_entries:
+                self._values.clear()
+            self._values.update(values)
+
+
+@st.cache_resource
+def _key_caches():
+    return {"patients": KeyCache(), "test_catalog": KeyCache(), "patient_names": KeyCache()}
+
+
+def _in_clause(columns, count):
+    if len(columns) == 1:
+        return f"{columns[0]} IN ({', '.join(['%s'] * count)})"
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    return f"({', '.join(columns)}) IN ({', '.join([row] * count)})"
+
+
+def _fold(key):
+    return tuple(str(v).casefold() for v in key)
+
+
+# Parallel bulk loaders insert overlapping keys. Sorting them makes every
+# statement lock in the same order; a deadlock that still happens (e.g.
+# against gap locks) is retried.
+def _insert_keys(query, values):
+    for attempt in range(KEY_INSERT_RETRIES + 1):
+        try:
+            return db.run_query(query, values)
+        except mysql.connector.Error as e:
+            if e.errno != DEADLOCK_ERRNO or attempt == KEY_INSERT_RETRIES:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def _ensure_ids(table, keys):
+    keys = set(keys)
+    cache = _key_caches()[table]
+    ids = cache.lookup(keys)
+    missing = sorted(keys - ids.keys())
+    if not missing:
+        return ids
+
+    columns = KEY_COLUMNS[table]
+    values = [v for key in missing for v in key]
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    _insert_keys(
+        f"INSERT IGNORE INTO {table} ({', '.join(columns)}) VALUES {', '.join([row] * len(missing))}",
+        values,
+    )
+    rows = db.run_query(
+        f"SELECT id, {', '.join(columns)} FROM {table} WHERE {_in_clause(columns, len(missing))}",
+        values,
+        fetch=True,
+    ) or []
+    found = {tuple(r[c] for c in columns): r["id"] for r in rows}
+    # A case-insensitive collation hands back the spelling stored first
+    folded = {_fold(k): i for k, i in found.items()}
+    new = {}
+    for key in missing:
+        new[key] = found.get(key) or folded.get(_fold(key))
+        if new[key] is None:
+            # The collation matched a spelling casefold doesn't (accents
+            # under *_ai_ci, ...); ask the server which row it meant
+            new[key] = _select_id(table, columns, key)
+    cache.store(new)
+    return {**ids, **new}
+
+
+def _select_id(table, columns, key):
+    where = " AND ".join(f"{c} = %s" for c in columns)
+    rows = db.run_query(f"SELECT id FROM {table} WHERE {where} LIMIT 1", key, fetch=True)
+    if not rows:
+        raise LookupError(f"{table} has no row for {key!r}")
+    return rows[0]["id"]
+
+
+# Keys are stripped before they reach the INSERT IGNORE: utf8mb4_bin is
+# PAD SPACE, so "Glucose " would otherwise hit the row stored for "Glucose"
+def patient_key(name):
+    return (str(name).strip(),)
+
+
+def patient_ids(names):
+    names = set(names)
+    ids = _ensure_ids("patients", {patient_key(n) for n in names})
+    return {n: ids[patient_key(n)] for n in names}
+
+
+def test_key(test_name, unit, ref_range):
+    return str(test_name).strip(), (unit or "").strip(), (ref_range or "").strip()
+
+
+def test_ids(keys):
+    return _ensure_ids("test_catalog", {test_key(*k) for k in keys})
+
+
+# ── Writes ──────────────────────────────────────────────────────────
+# rows: (name, test_name, result, unit, ref_range, flag, timestamp), the
+# shape bulk_import.validate returns. One multi-row INSERT into
+# lab_results; `ids` keeps caller-chosen primary keys (app6.py).
+def insert_reports(rows, ids=None):
+    rows = list(rows)
+    if not rows:
+        return 0
+    patients = patient_ids(r[0] for r in rows)
+    tests = test_ids((r[1], r[3], r[4]) for r in rows)
+    values = [
+        (patients[name], tests[test_key(test_name, unit, ref_range)], result, flag, timestamp)
+        for name, test_name, result, unit, ref_range, flag, timestamp in rows
+    ]
+    if ids is None:
+        return db.execute_many(LAB_RESULTS_SQL, values)
+    return db.execute_many(LAB_RESULTS_WITH_ID_SQL, [(i, *v) for i, v in zip(ids, values)])
+
+
+# ── Reads ───────────────────────────────────────────────────────────
+# lab_results rows travel as integers and are expanded here from the
+# cached test catalog and patient names, instead of repeating the
+# strings in every row the server sends
+def test_catalog(ids=()):
+    query = "SELECT id, test_name, unit, ref_range FROM test_catalog"
+    catalog = {r["id"]: r for r in db.run_query(query, fetch=True, cache=True) or []}
+    if set(ids) - catalog.keys():
+        # Tests added by another process since the catalog was cached
+        db.get_query_cache().invalidate({"test_catalog"})
+        catalog = {r["id"]: r for r in db.run_query(query, fetch=True, cache=True) or []}
+    return catalog
+
+
+def patient_names_by_id(ids):
+    ids = set(ids)
+    cache = _key_caches()["patient_names"]
+    names = cache.lookup(ids)
+    missing = list(ids - names.keys())
+    if missing:
+        rows = db.run_query(
+            f"SELECT id, name FROM patients WHERE {_in_clause(('id',), len(missing))}",
+            missing,
+            fetch=True,
+        ) or []
+        found = {r["id"]: r["name"] for r in rows}
+        cache.store(found)
+        names.update(found)
+    return names
+
+
+# → rows shaped like the blood_reports view
+def expand(rows):
+    if not rows:
+        return []
+    tests = test_catalog({r["test_id"] for r in rows})
+    names = patient_names_by_id(r["patient_id"] for r in rows)
+    expanded = []
+    for r in rows:
+        test = tests[r["test_id"]]
+        expanded.append({
+            "id": r["id"],
+            "name": names[r["patient_id"]],
+            "timestamp": r["timestamp"],
+            "test_name": test["test_name"],
+            "result": r["result"],
+            "unit": test["unit"],
+            "ref_range": test["ref_range"],
+            "flag": r["flag"],
+        })
+    return expanded
+
+
+# clause: anything after `FROM lab_results r` (JOINs, WHERE, ORDER BY, LIMIT)
+def fetch_reports(clause="", params=None, cache=False):
+    rows = db.run_query(f"SELECT {RESULT_COLUMNS} FROM lab_results r {clause}", params, fetch=True, cache=cache)
+    return expand(rows or [])
+
+
+# Ids only, same clause shape (for the vector index's catch-up scans)
+def report_ids(clause="", params=None):
+    rows = db.run_query(f"SELECT r.id FROM lab_results r {clause}", params, fetch=True)
+    return [r["id"] for r in rows or []]
+
+
+# Patient search: unique-key lookup on patients.name, then a range read of
+# idx_lab_results_patient_ts
+def search_reports(name, start, end, cache=True):
+    return fetch_reports(
+        """
+        JOIN patients p ON p.id = r.patient_id
+        WHERE p.name = %s
+        AND r.timestamp >= %s
+        AND r.timestamp < %s
+        ORDER BY r.timestamp DESC
+        """,
+        (name, start, end),
+        cache,
+    )
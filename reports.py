@@ -0,0 +1,35 @@
+from records import fetch_reports
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+# ── Keyset pagination over (timestamp, id) ──────────────────────────
+# `after` is the (timestamp, id) of the last row on the previous page, so
+# every page is an index range read regardless of how deep it is.
+def fetch_page(page_size=50, after=None):
+    if after is None:
+        rows = fetch_reports(
+            """
+            ORDER BY r.timestamp DESC, r.id DESC
+            LIMIT %s
+            """,
+            (page_size + 1,),
+            cache=True,
+        )
+    else:
+        last_ts, last_id = after
+        rows = fetch_reports(
+            """
+            WHERE r.timestamp < %s OR (r.timestamp = %s AND r.id < %s)
+            ORDER BY r.timestamp DESC, r.id DESC
+            LIMIT %s
+            """,
+            (last_ts, last_ts, last_id, page_size + 1),
+            cache=True,
+        )
+
+    # One extra row tells us whether there is a next page
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = (rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+    return rows, next_cursor
@@ -0,0 +1,16 @@
+import pandas as pd
+
+import abnormal
+
+
+def test_recorded_flag_sets_status_of_in_range_result():
+    df = pd.DataFrame({
+        "result": [105, 150, 90],
+        "ref_range": ["70-110", "70-110", "70-110"],
+        "flag": ["High", "", ""],
+    })
+
+    flagged = abnormal.detect(df)
+
+    assert flagged["status"].tolist() == ["High", "High", "Normal"]
+    assert flagged["abnormal"].tolist() == [True, True, False]
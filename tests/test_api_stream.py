@@ -0,0 +1,79 @@
+import asyncio
+
+from starlette.concurrency import iterate_in_threadpool
+
+import api
+
+ANSWER_TOKENS = ["Glucose ", "is ", "above range."]
+
+
+class FakeIndex:
+    def sync(self):
+        return 0
+
+    def count(self, filters):
+        return 1
+
+
+class FakeChain:
+    def stream(self, inputs):
+        yield from ANSWER_TOKENS
+
+
+class FakeAnswerCache:
+    def __init__(self):
+        self.answers = {}
+
+    def key(self, *parts):
+        return "key"
+
+    def get(self, key):
+        return self.answers.get(key)
+
+    def put(self, key, answer, report_ids):
+        self.answers[key] = answer
+
+
+# StreamingResponse advances a sync generator with iterate_in_threadpool,
+# each step in a copied context; the stream must still reach "done" and
+# fill the answer cache
+def test_streamed_analysis_completes_in_threadpool(monkeypatch):
+    cache = FakeAnswerCache()
+    counts = {"rows": 2, "abnormal": 1}
+
+    async def load_rag_resources():
+        return FakeIndex(), None, object()
+
+    monkeypatch.setattr(api, "load_rag_resources", load_rag_resources)
+    monkeypatch.setattr(api, "abnormal_context", lambda *args, **kwargs: ([], counts, {"tokens": 0}))
+    monkeypatch.setattr(api, "build_answer_chain", lambda llm: FakeChain())
+    monkeypatch.setattr(api, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(api, "doc_report_ids", lambda docs: [])
+
+    async def collect():
+        events = api.analysis_events(api.AnalysisRequest(name="Mary Smith"))
+        return [event async for event in iterate_in_threadpool(events)]
+
+    events = asyncio.run(collect())
+
+    assert events[0] == {"event": "context", "rows": 2, "abnormal": 1, "packing": {"tokens": 0}}
+    assert [e["text"] for e in events if e["event"] == "token"] == ANSWER_TOKENS
+    assert events[-1]["event"] == "done" and events[-1]["cached"] is False
+    assert cache.answers["key"] == "".join(ANSWER_TOKENS)
+
+
+# stream=false must sync the index before deciding nothing matches
+def test_unstreamed_analysis_syncs_before_counting(monkeypatch):
+    class UnsyncedIndex:
+        synced = False
+
+        def sync(self):
+            self.synced = True
+
+        def count(self, filters):
+            return 1 if self.synced else 0
+
+    monkeypatch.setattr(api, "get_report_index", UnsyncedIndex)
+    monkeypatch.setattr(api, "run_rag_analysis", lambda filters, query: {"answer": "ok"})
+
+    assert api.analyze(api.AnalysisRequest(name="Mary Smith"), stream=False) == {"answer": "ok"}
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import bulk_import
+
+HL7 = """MSH|^~\\&|LAB|HOSP|||20240102||ORU^R01|1|P|2.5
+PID|1||123||Doe^John
+OBX|1|NM|2345-7^Glucose||150|mg/dL|70-110|H|||F|||20240102083000
+OBX|2|NM|718-7^Hemoglobin||14.1|g/dL|13.5-17.5|N|||F|||20240102083000
+PID|2||456||Smith^Mary
+OBX|1|NM|GLU||92|mg/dL
+""".splitlines()
+
+
+def test_hl7_reads_every_obx_under_its_pid():
+    records = list(bulk_import.parse_hl7(HL7))
+
+    assert [(r["name"], r["test_name"], r["result"], r["flag"]) for r in records] == [
+        ("John Doe", "Glucose", "150", "High"),
+        ("John Doe", "Hemoglobin", "14.1", "Normal"),
+        ("Mary Smith", "GLU", "92", ""),
+    ]
+    assert records[0]["timestamp"] == "20240102083000"
+    assert records[2]["_line"] == 6
+
+
+# OBX lines that stop early get empty range/flag/time fields
+def test_hl7_short_obx_is_padded():
+    record = list(bulk_import.parse_hl7(HL7))[2]
+    assert (record["ref_range"], record["flag"], record["timestamp"]) == ("", "", "")
+
+    row = bulk_import.validate(record)
+    assert row[:6] == ("Mary Smith", "GLU", 92.0, "mg/dL", "", "")
+
+
+def test_csv_without_timestamp_is_stamped_now():
+    lines = ["Name, Test_Name ,result,unit,ref_range,flag", "Mary Smith,Glucose,92,mg/dL,70-110,"]
+    record = next(bulk_import.parse_csv(lines))
+    before = datetime.now()
+
+    name, test_name, result, unit, ref_range, flag, timestamp = bulk_import.validate(record)
+    assert (name, test_name, result, unit, ref_range, flag) == ("Mary Smith", "Glucose", 92.0, "mg/dL", "70-110", "")
+    assert timestamp >= before
+
+
+def test_hl7_and_iso_timestamps_parse():
+    assert bulk_import.parse_timestamp("20240102") == datetime(2024, 1, 2)
+    assert bulk_import.parse_timestamp("202401020830") == datetime(2024, 1, 2, 8, 30)
+    assert bulk_import.parse_timestamp("2024-01-02 08:30:00") == datetime(2024, 1, 2, 8, 30)
+
+
+# Bad rows are rejected with their line number; the rest still load
+def test_invalid_rows_are_rejected_and_the_rest_load(monkeypatch):
+    inserted = []
+    monkeypatch.setattr(bulk_import.records, "insert_reports", lambda batch: inserted.extend(batch) or len(batch))
+    lines = [
+        "name,test_name,result,unit,ref_range,flag,timestamp",
+        "Mary Smith,Glucose,92,mg/dL,70-110,,2024-01-02",
+        "Mary Smith,Glucose,n/a,mg/dL,70-110,,2024-01-02",
+        ",Glucose,90,mg/dL,70-110,,2024-01-02",
+        "Mary Smith,Glucose,95,mg/dL,70-110,,yesterday",
+        "John Doe,LDL,130,mg/dL,<100,High,2024-01-03",
+    ]
+
+    stats = bulk_import.import_stream(lines, "results.csv", batch_size=2, workers=1)
+
+    assert stats.loaded == 2 and stats.rejected == 3
+    assert [row[0] for row in inserted] == ["Mary Smith", "John Doe"]
+    assert stats.errors[0] == "results.csv:3: result is not numeric: 'n/a'"
+    assert stats.errors[1] == "results.csv:4: name and test_name are required"
+    assert stats.errors[2] == "results.csv:5: bad timestamp: 'yesterday'"
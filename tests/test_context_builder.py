@@ -0,0 +1,74 @@
+from context_builder import count_tokens, doc_report_ids, pack_rows
+
+
+def row(id, name, test_name, result, timestamp, status="High"):
+    return {
+        "id": id, "name": name, "test_name": test_name, "result": result, "unit": "mg/dL",
+        "ref_range": "70-110", "flag": "", "status": status, "timestamp": timestamp,
+    }
+
+
+ROWS = [
+    row(1, "John Doe", "Glucose", 180, "2024-03-01"),
+    row(2, "Mary Smith", "LDL", 160, "2024-02-01"),
+    row(3, "John Doe", "Glucose", 150, "2024-01-02"),
+    row(4, "John Doe", "LDL", 140, "2024-01-05"),
+]
+
+
+def text(docs):
+    return "\n".join(d.page_content for d in docs)
+
+
+# One document per patient, each test's unit/range written once and its
+# results in date order
+def test_rows_are_grouped_by_patient_and_test():
+    docs, info = pack_rows(ROWS)
+
+    assert [d.page_content for d in docs] == [
+        "Patient: John Doe\n"
+        "  Glucose [mg/dL, ref 70-110]: 2024-01-02 150 High; 2024-03-01 180 High;\n"
+        "  LDL [mg/dL, ref 70-110]: 2024-01-05 140 High;",
+        "Patient: Mary Smith\n"
+        "  LDL [mg/dL, ref 70-110]: 2024-02-01 160 High;",
+    ]
+    assert docs[0].metadata["ids"] == [3, 1, 4]
+    assert sorted(doc_report_ids(docs)) == [1, 2, 3, 4]
+    assert info["rows"] == info["candidates"] == 4
+
+
+def test_output_stays_within_the_budget():
+    rows = [row(i, f"Patient {i % 7}", f"Test {i % 5}", 100 + i, f"2024-01-{i % 28 + 1:02d}") for i in range(500)]
+
+    docs, info = pack_rows(rows, budget=300)
+
+    assert info["tokens"] <= 300
+    assert count_tokens(text(docs)) <= 300
+    assert 0 < info["rows"] < info["candidates"]
+    # Patients and tests are never split across documents or headers
+    names = [d.page_content.splitlines()[0] for d in docs]
+    assert len(names) == len(set(names))
+    for d in docs:
+        headers = [line.split(":")[0] for line in d.page_content.splitlines()[1:]]
+        assert len(headers) == len(set(headers))
+
+
+# A row too large for what's left is skipped; later, smaller rows still fit
+def test_packing_skips_rows_that_do_not_fit():
+    long_name = row(9, "A" * 400, "Glucose", 150, "2024-01-02")
+    docs, info = pack_rows([long_name, *ROWS], budget=60)
+
+    assert info["rows"] > 0
+    assert 9 not in doc_report_ids(docs)
+
+
+def test_preamble_takes_at_most_half_the_budget_in_whole_lines():
+    preamble = "\n".join(f"Test {i}: 10 results, 2 abnormal, latest 150 High" for i in range(50))
+
+    docs, info = pack_rows(ROWS, budget=200, preamble=preamble)
+
+    summary = docs[0].page_content
+    assert docs[0].metadata["kind"] == "summary"
+    assert count_tokens(summary) <= 100
+    assert preamble.startswith(summary) and preamble[len(summary)] == "\n"
+    assert info["tokens"] <= 200 and info["rows"] == 4
@@ -0,0 +1,68 @@
+from batch_report import UPSERT_SQL
+from db import QueryCache, tables_in
+
+
+# A SELECT that started before a write must not cache its (stale) rows
+# after the write's invalidation has already run
+def test_put_skips_rows_read_before_a_write():
+    cache = QueryCache()
+    key = QueryCache.key("SELECT * FROM patients", None)
+    tables = {"patients"}
+
+    generation = cache.generation(tables)
+    cache.invalidate({"patients"})
+    cache.put(key, tables, [{"id": 1}], generation)
+    assert cache.get(key) is None
+
+    generation = cache.generation(tables)
+    cache.clear()
+    cache.put(key, tables, [{"id": 1}], generation)
+    assert cache.get(key) is None
+
+    cache.put(key, tables, [{"id": 1}], cache.generation(tables))
+    assert cache.get(key) == [{"id": 1}]
+
+
+def test_entries_expire_after_the_ttl():
+    cache = QueryCache(ttl=-1)
+    key = QueryCache.key("SELECT * FROM patients", None)
+    cache.put(key, {"patients"}, [{"id": 1}])
+
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = QueryCache(max_entries=2)
+    a, b, c = (QueryCache.key(f"SELECT * FROM {t}", None) for t in ("a", "b", "c"))
+    cache.put(a, {"a"}, [1])
+    cache.put(b, {"b"}, [2])
+    cache.get(a)
+    cache.put(c, {"c"}, [3])
+
+    assert cache.get(b) is None
+    assert cache.get(a) == [1] and cache.get(c) == [3]
+
+
+def test_invalidate_drops_only_reads_of_the_written_tables():
+    cache = QueryCache()
+    reports = QueryCache.key("SELECT * FROM blood_reports", None)
+    summaries = QueryCache.key("SELECT * FROM report_summaries", None)
+    cache.put(reports, tables_in("SELECT * FROM blood_reports"), [1])
+    cache.put(summaries, tables_in("SELECT * FROM report_summaries"), [2])
+
+    cache.invalidate(tables_in("INSERT INTO lab_results (id) VALUES (%s)"))
+    assert cache.get(reports) is None
+    assert cache.get(summaries) == [2]
+
+
+def test_tables_in_reads_schema_qualified_names():
+    assert tables_in("UPDATE mydb.lab_results SET flag = %s WHERE id = %s") == {"lab_results"}
+    assert tables_in("DELETE FROM `mydb`.`lab_results` WHERE id = %s") == {"lab_results"}
+    assert tables_in("SELECT r.id FROM lab_results r JOIN mydb.patients p ON p.id = r.patient_id") == {
+        "lab_results", "patients",
+    }
+
+
+def test_tables_in_ignores_on_duplicate_key_update_columns():
+    assert tables_in(UPSERT_SQL) == {"report_summaries"}
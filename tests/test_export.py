@@ -0,0 +1,45 @@
+import io
+from datetime import datetime
+
+import pyarrow.parquet as pq
+from mysql.connector.constants import FieldType
+
+import export
+
+# cursor.description of SELECT id, name, result, timestamp FROM blood_reports
+DESCRIPTION = [
+    ("id", FieldType.LONGLONG, None, None, None, None, 0, 0, 63),
+    ("name", FieldType.VAR_STRING, None, None, None, None, 0, 0, 45),
+    ("result", FieldType.DOUBLE, None, None, None, None, 1, 0, 63),
+    ("timestamp", FieldType.DATETIME, None, None, None, None, 0, 0, 63),
+]
+
+
+def row(id, result):
+    return {"id": id, "name": "Mary Smith", "result": result, "timestamp": datetime(2024, 1, 2)}
+
+
+# A column that is NULL throughout the first chunk keeps its DOUBLE type
+def test_parquet_schema_comes_from_the_cursor():
+    out = io.BytesIO()
+    export.write_parquet([[row(1, None)], [row(2, 5.5)]], out, DESCRIPTION)
+
+    table = pq.read_table(io.BytesIO(out.getvalue()))
+    assert str(table.schema.field("result").type) == "double"
+    assert table.column("result").to_pylist() == [None, 5.5]
+
+
+def test_empty_result_is_a_valid_parquet_file():
+    out = io.BytesIO()
+    export.write_parquet([], out, DESCRIPTION)
+
+    table = pq.read_table(io.BytesIO(out.getvalue()))
+    assert table.num_rows == 0
+    assert table.column_names == ["id", "name", "result", "timestamp"]
+
+
+def test_iter_file_serves_chunks_and_closes():
+    f = io.BytesIO(b"x" * 10)
+
+    assert list(export.iter_file(f, chunk_size=4)) == [b"xxxx", b"xxxx", b"xx"]
+    assert f.closed
@@ -0,0 +1,26 @@
+import pandas as pd
+
+import abnormal
+import generate_data
+
+
+def generated(rows=20_000):
+    return pd.concat(generate_data.generate(rows, patients=100, seed=7, chunk_size=5000), ignore_index=True)
+
+
+# Recorded flags must agree with the printed reference range, including
+# one-sided ranges like "<100" and ">40"
+def test_flags_agree_with_detection():
+    df = generated()
+    recorded = df[df["flag"] != ""]
+
+    detected = abnormal.detect(recorded.assign(flag=""))
+    assert (detected["status"] == recorded["flag"]).all()
+
+
+def test_one_sided_ranges_are_flagged_on_their_bound_only():
+    df = generated()
+
+    assert not ((df["ref_range"] == "<100") & (df["flag"] == "Low")).any()
+    assert not ((df["ref_range"] == ">40") & (df["flag"] == "High")).any()
+    assert ((df["ref_range"] == "<100") & (df["flag"] == "High")).any()
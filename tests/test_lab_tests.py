@@ -0,0 +1,42 @@
+import lab_tests
+
+STORED = ["Glucose", "Hemoglobin", "HbA1c", "Cholesterol", "LDL Cholesterol", "HDL Cholesterol",
+          "Vitamin D", "Vitamin B12", "WBC", "Triglycerides"]
+
+
+def match(question, names=STORED):
+    return lab_tests.TestNameResolver(names).match(question)
+
+
+def test_everyday_names_resolve_to_stored_tests():
+    assert match("what is my sugar level?") == ["Glucose"]
+    assert match("is my Hb low") == ["Hemoglobin"]
+    assert match("how is my good cholesterol") == ["HDL Cholesterol"]
+
+
+# The canonical word matches every stored name containing it, like the old
+# LIKE '%cholesterol%'; a longer phrase wins at its position
+def test_canonical_word_matches_every_stored_name_containing_it():
+    assert match("cholesterol trend") == ["Cholesterol", "HDL Cholesterol", "LDL Cholesterol"]
+    assert match("ldl cholesterol trend") == ["LDL Cholesterol"]
+
+
+def test_multi_word_names_and_aliases():
+    assert match("show vitamin d and vitamin b12") == ["Vitamin B12", "Vitamin D"]
+    assert match("white blood cells and trigs") == ["Triglycerides", "WBC"]
+    assert match("blood sugar with a1c") == ["Glucose", "HbA1c"]
+
+
+# Words are matched whole, case- and plural-insensitive
+def test_whole_words_only():
+    assert match("GLUCOSE results") == ["Glucose"]
+    assert match("my hdls") == ["HDL Cholesterol"]
+    assert match("vitamin levels") == []
+    assert match("hbx") == []
+
+
+# Stored names outside the synonym table still resolve by their own words,
+# and aliases for tests that aren't stored resolve to nothing
+def test_only_stored_tests_are_returned():
+    assert match("serum potassium please", ["Serum Potassium", "Glucose"]) == ["Serum Potassium"]
+    assert match("tsh and ferritin") == []
@@ -0,0 +1,54 @@
+import patient_search
+from patient_search import NameIndex
+
+NAMES = ["Priya Sharma", "Hiroshi Tanaka", "John Johnson", "Joan Jensen", "Mary Smith", "José Garcia"]
+
+
+def name_index(names=NAMES):
+    index = NameIndex()
+    index.add([{"id": i, "name": name} for i, name in enumerate(names, start=1)])
+    return index
+
+
+def best(index, query):
+    name, _, how = index.search(query)[0]
+    return name, how
+
+
+def test_prefix_match():
+    assert best(name_index(), "pri sha") == ("Priya Sharma", "prefix")
+
+
+def test_typo_match():
+    assert best(name_index(), "Hiroshi Tanka") == ("Hiroshi Tanaka", "similar")
+
+
+def test_sound_alike_match():
+    assert best(name_index(), "Jon Jonson") == ("John Johnson", "sounds like")
+
+
+def test_exact_match_ignores_case_and_accents():
+    assert best(name_index(), "jose garcia") == ("José Garcia", "exact")
+
+
+def test_typed_words_must_match_different_name_words():
+    assert "prefix" not in {how for _, _, how in name_index().search("jo jo jo")}
+
+
+# A patient whose lower id commits after a higher one was already read
+def test_name_index_picks_up_ids_committed_out_of_order(monkeypatch):
+    patients = [{"id": 1, "name": "Mary Smith"}, {"id": 3, "name": "John Johnson"}]
+    index = NameIndex()
+    monkeypatch.setattr(patient_search, "_name_index", lambda: index)
+
+    def run_query(query, params=None, fetch=False, cache=False):
+        if "COUNT" in query:
+            return [{"n": len(patients)}]
+        return [p for p in sorted(patients, key=lambda p: p["id"]) if p["id"] > params[0]]
+
+    monkeypatch.setattr(patient_search, "run_query", run_query)
+    assert len(patient_search.get_name_index()) == 2
+
+    patients.append({"id": 2, "name": "Priya Sharma"})
+    assert len(patient_search.get_name_index()) == 3
+    assert best(index, "priya") == ("Priya Sharma", "prefix")
@@ -0,0 +1,48 @@
+import re
+
+import records
+
+
+# Stands in for the patients/test_catalog tables under utf8mb4_bin, which
+# is PAD SPACE: trailing spaces are ignored when comparing keys
+class PadSpaceTables:
+    def __init__(self):
+        self.rows = {"patients": [], "test_catalog": []}
+
+    @staticmethod
+    def _same(a, b):
+        return str(a).rstrip(" ") == str(b).rstrip(" ")
+
+    def _find(self, table, key):
+        for row in self.rows[table]:
+            if all(self._same(row[c], v) for c, v in zip(records.KEY_COLUMNS[table], key)):
+                return row
+        return None
+
+    def run_query(self, query, params=None, fetch=False, cache=False):
+        table = re.search(r"(?:INTO|FROM) (\w+)", query).group(1)
+        columns = records.KEY_COLUMNS[table]
+        if query.startswith("INSERT IGNORE"):
+            for i in range(0, len(params), len(columns)):
+                key = tuple(params[i:i + len(columns)])
+                if self._find(table, key) is None:
+                    row = dict(zip(columns, key), id=len(self.rows[table]) + 1)
+                    self.rows[table].append(row)
+            return None
+        keys = [tuple(params[i:i + len(columns)]) for i in range(0, len(params), len(columns))]
+        found = [self._find(table, key) for key in keys]
+        return [row for row in found if row is not None]
+
+
+def test_padded_keys_map_to_the_stored_rows(monkeypatch):
+    tables = PadSpaceTables()
+    tables.rows["patients"].append({"id": 1, "name": "John Doe"})
+    tables.rows["test_catalog"].append({"id": 1, "test_name": "Glucose", "unit": "mg/dL", "ref_range": "70-100"})
+    caches = {"patients": records.KeyCache(), "test_catalog": records.KeyCache()}
+    monkeypatch.setattr(records, "_key_caches", lambda: caches)
+    monkeypatch.setattr(records.db, "run_query", tables.run_query)
+
+    assert records.patient_ids([" John Doe", "John Doe "]) == {" John Doe": 1, "John Doe ": 1}
+    key = records.test_key("Glucose ", "mg/dL ", "70-100")
+    assert records.test_ids([("Glucose ", "mg/dL ", "70-100")]) == {key: 1}
+    assert len(tables.rows["patients"]) == 1 and len(tables.rows["test_catalog"]) == 1
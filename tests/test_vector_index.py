@@ -0,0 +1,111 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import vector_index
+from rag import abnormal_context
+from vector_index import ReportIndex
+
+
+def report(id, name, test_name, result, ref_range, flag, timestamp):
+    return {
+        "id": id, "name": name, "test_name": test_name, "result": result,
+        "unit": "mg/dL", "ref_range": ref_range, "flag": flag, "timestamp": timestamp,
+    }
+
+
+ROWS = [
+    report(1, "Mary Smith", "Glucose", 150, "70-110", "", "2024-01-02 08:00:00"),
+    report(2, "Mary Smith", "Glucose", 90, "70-110", "", "2024-02-02 08:00:00"),
+    report(3, "Mary Smith", "LDL", 105, "<130", "High", "2024-02-02 08:00:00"),
+    report(4, "John Doe", "Glucose", 60, "70-110", "", "2024-01-05 08:00:00"),
+]
+
+
+# Detection is stored at upsert time; the analysis reads only abnormal rows
+# and the per-test summary comes from SQL
+def test_abnormal_context_uses_stored_status(tmp_path):
+    index = ReportIndex(str(tmp_path / "index.sqlite"), DeterministicFakeEmbedding(size=8))
+    index.upsert(ROWS)
+
+    summary = index.test_summary({"name": "mary smith"}).set_index("test_name")
+    assert summary.loc["Glucose", ["results", "abnormal", "high", "latest", "latest_status"]].tolist() == [
+        2, 1, 1, 90.0, "Normal",
+    ]
+    assert summary.loc["LDL", "latest_status"] == "High"
+
+    docs, counts, info = abnormal_context(index, {"name": "Mary Smith"}, "abnormal results")
+    assert counts == {"rows": 3, "abnormal": 2}
+    assert info["rows"] == 2
+    assert sorted(docs[1].metadata["ids"]) == [1, 3]
+    assert "105 High" in docs[1].page_content
+
+
+# Stands in for records.fetch_reports/report_ids over the queries sync() issues
+def fake_fetch(rows):
+    def fetch_reports(clause, params):
+        if clause.startswith("WHERE r.id IN"):
+            return [r for r in rows if r["id"] in params]
+        if clause.startswith("WHERE r.timestamp >"):
+            ts, _, after_id, limit = params
+            found = sorted((r for r in rows if (r["timestamp"], r["id"]) > (ts, after_id)),
+                           key=lambda r: (r["timestamp"], r["id"]))
+        else:
+            after_id, ts, _, cursor_id, limit = params
+            found = sorted((r for r in rows if r["id"] > after_id and (r["timestamp"], r["id"]) <= (ts, cursor_id)),
+                           key=lambda r: r["id"])
+        return found[:limit]
+    return fetch_reports
+
+
+def use_rows(monkeypatch, rows):
+    fetch_reports = fake_fetch(rows)
+    monkeypatch.setattr(vector_index.records, "fetch_reports", fetch_reports)
+    monkeypatch.setattr(vector_index.records, "report_ids",
+                        lambda clause, params: [r["id"] for r in fetch_reports(clause, params)])
+
+
+# Day-resolution stamps: an interrupted sync must resume inside the shared
+# timestamp rather than skip the rest of that day
+def test_interrupted_sync_resumes_at_the_cursor(tmp_path, monkeypatch):
+    rows = [report(i, "Mary Smith", "Glucose", 90, "70-110", "", "2024-01-02 00:00:00") for i in range(1, 6)]
+    use_rows(monkeypatch, rows)
+    index = ReportIndex(str(tmp_path / "index.sqlite"), DeterministicFakeEmbedding(size=8))
+
+    upsert = index.upsert
+    calls = []
+
+    def failing_upsert(batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise RuntimeError("interrupted")
+        return upsert(batch)
+
+    monkeypatch.setattr(index, "upsert", failing_upsert)
+    with pytest.raises(RuntimeError):
+        index.sync(batch_size=2)
+    assert index.filter_ids({}) == [1, 2]
+
+    monkeypatch.setattr(index, "upsert", upsert)
+    index.sync(batch_size=2)
+    assert sorted(index.filter_ids({})) == [1, 2, 3, 4, 5]
+
+    # A backdated row inserted later is picked up by id
+    rows.append(report(6, "Mary Smith", "Glucose", 90, "70-110", "", "2023-12-01 00:00:00"))
+    assert index.sync(batch_size=2) == 1
+
+
+# Ids that commit out of order: id 4 becomes visible after id 5 was synced
+# past it, with a stamp already behind the cursor
+def test_late_commit_below_the_watermarks_is_indexed(tmp_path, monkeypatch):
+    rows = [report(i, "Mary Smith", "Glucose", 90, "70-110", "", "2024-01-02 00:00:00") for i in (1, 2, 3)]
+    use_rows(monkeypatch, rows)
+    index = ReportIndex(str(tmp_path / "index.sqlite"), DeterministicFakeEmbedding(size=8))
+    index.sync(batch_size=2)
+
+    rows.append(report(5, "Mary Smith", "Glucose", 90, "70-110", "", "2024-01-03 00:00:00"))
+    index.sync(batch_size=2)
+    rows.append(report(4, "Mary Smith", "Glucose", 90, "70-110", "", "2024-01-02 00:00:00"))
+
+    assert index.sync(batch_size=2) == 1
+    assert sorted(index.filter_ids({})) == [1, 2, 3, 4, 5]
+    assert index.sync(batch_size=2) == 0
@@ -0,0 +1,169 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+import numpy as np
+
+# Optional exporters: spans are forwarded to OpenTelemetry (a no-op unless
+# an SDK/exporter is configured) and to a Prometheus histogram when the
+# packages are installed
+try:
+    from opentelemetry import trace as otel_trace
+    _tracer = otel_trace.get_tracer("blood_reports")
+except ImportError:
+    _tracer = None
+
+try:
+    import prometheus_client
+    _histogram = prometheus_client.Histogram(
+        "blood_reports_stage_seconds", "Duration of traced stages", ["stage"]
+    )
+except ImportError:
+    prometheus_client = None
+    _histogram = None
+
+SPAN_HISTORY = 500  # recent durations kept per stage for percentiles
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_depth = contextvars.ContextVar("span_depth", default=0)
+
+
+# ── Process-wide latency stats ──────────────────────────────────────
+class LatencyStats:
+    def __init__(self, history=SPAN_HISTORY):
+        self._lock = threading.Lock()
+        self._recent = defaultdict(lambda: deque(maxlen=history))
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._recent[name].append(seconds)
+            self._counts[name] += 1
+            self._totals[name] += seconds
+
+    def summary(self):
+        with self._lock:
+            recent = {name: np.array(values) * 1000 for name, values in self._recent.items()}
+            counts, totals = dict(self._counts), dict(self._totals)
+        return [
+            {
+                "stage": name,
+                "count": counts[name],
+                "mean_ms": round(totals[name] * 1000 / counts[name], 1),
+                "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1),
+                "max_ms": round(float(ms.max()), 1),
+            }
+            for name, ms in sorted(recent.items())
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+
+STATS = LatencyStats()
+
+
+# ── Per-request trace ───────────────────────────────────────────────
+# Collects every span finished inside `with trace(...)`, including spans in
+# threads started via asyncio.to_thread (which copies the context)
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, depth, start, seconds, attrs):
+        self.spans.append((start - self.started, depth, name, seconds, dict(attrs)))
+
+    def table(self):
+        return [
+            {
+                "stage": "  " * depth + name,
+                "start_ms": round(offset * 1000, 1),
+                "ms": round(seconds * 1000, 1),
+                "detail": ", ".join(f"{k}={v}" for k, v in attrs.items()),
+            }
+            for offset, depth, name, seconds, attrs in sorted(self.spans, key=lambda s: (s[0], s[1]))
+        ]
+
+
+@contextmanager
+def trace(name):
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        with span(name):
+            yield current
+    finally:
+        _current_trace.reset(token)
+
+
+# ── Spans ───────────────────────────────────────────────────────────
+# with span("db.query") as attrs:  ...  attrs["rows"] = len(rows)
+@contextmanager
+def span(name, **attrs):
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    with _tracer.start_as_current_span(name) if _tracer else nullcontext() as otel_span:
+        try:
+            yield attrs
+        finally:
+            seconds = time.perf_counter() - start
+            _depth.reset(token)
+            if otel_span is not None:
+                otel_span.set_attributes(_otel_attributes(attrs))
+            _record(name, depth, start, seconds, attrs)
+
+
+def _otel_attributes(attrs):
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in attrs.items()}
+
+
+def _record(name, depth, start, seconds, attrs):
+    STATS.record(name, seconds)
+    if _histogram is not None:
+        _histogram.labels(name).observe(seconds)
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, depth, start, seconds, attrs)
+
+
+# A stage that started at `start` (perf_counter) and ends now, for work
+# spread over generator yields. A `with span(...)` held open across yields
+# breaks when each step runs in a different context, as Starlette does
+# when it streams a sync generator through its thread pool.
+def record_span(name, start, **attrs):
+    seconds = time.perf_counter() - start
+    if _tracer is not None:
+        otel_span = _tracer.start_span(name, start_time=time.time_ns() - int(seconds * 1e9))
+        otel_span.set_attributes(_otel_attributes(attrs))
+        otel_span.end()
+    _record(name, _depth.get(), start, seconds, attrs)
+
+
+def traced(name):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def latency_summary():
+    return STATS.summary()
+
+
+# Prometheus exposition text (for an HTTP /metrics endpoint), or None
+def prometheus_text():
+    return prometheus_client.generate_latest() if prometheus_client else None
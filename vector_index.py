@@ -0,0 +1,433 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+import pandas as pd
+import streamlit as st
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import abnormal
+import records
+from models import EMBED_MODEL, get_embeddings
+from tracing import span, traced
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vector_index")
+
+# Filtered subsets up to this size are scored directly from their own
+# vectors; larger ones use a FAISS search restricted by an ID selector
+DIRECT_SEARCH_MAX = 20_000
+SYNC_BATCH_SIZE = 5000  # rows fetched and embedded per catch-up step
+# Ids below the `last_id` watermark re-checked on every sync: parallel bulk
+# batches and TiDB's per-server AUTO_INCREMENT caches commit ids out of order
+SYNC_ID_LAG = 50_000
+
+
+# ── Row → document text ─────────────────────────────────────────────
+def report_text(r):
+    return (
+        f"Patient: {r['name']} | Test: {r['test_name']} | "
+        f"Result: {r['result']} {r['unit']} | Ref Range: {r['ref_range']} | "
+        f"Flag: {r['flag']} | Date: {r.get('timestamp', 'N/A')}"
+    )
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ── Persistent FAISS index keyed by blood_reports.id ────────────────
+# Vectors and texts live in a SQLite file so every change is written
+# incrementally; the FAISS index itself is rebuilt in memory once per
+# process from that file and then kept up to date in place.
+class ReportIndex:
+    def __init__(self, path, embeddings):
+        self.path = path
+        self.embeddings = embeddings
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()  # one catch-up at a time; searches carry on
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                test_name TEXT,
+                flag TEXT,
+                timestamp TEXT,
+                result REAL,
+                unit TEXT,
+                ref_range TEXT,
+                low REAL,
+                high REAL,
+                status TEXT,
+                abnormal INTEGER NOT NULL DEFAULT 0,
+                text TEXT NOT NULL,
+                vector BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            -- metadata pre-filters: per-patient partitions + test/flag lookups
+            CREATE INDEX IF NOT EXISTS idx_docs_name_ts ON docs (name COLLATE NOCASE, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_docs_test_ts ON docs (test_name COLLATE NOCASE, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_docs_flag ON docs (flag COLLATE NOCASE);
+            """
+        )
+        self._upgrade()
+        self._index = self._load()
+
+    # Index files from before result/unit/ref_range or the detected
+    # status were stored: add the columns and reset the watermark so the
+    # next sync refills them (the vectors come straight back from the
+    # embedding cache)
+    def _upgrade(self):
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(docs)")}
+        added = (
+            "result REAL", "unit TEXT", "ref_range TEXT",
+            "low REAL", "high REAL", "status TEXT", "abnormal INTEGER NOT NULL DEFAULT 0",
+        )
+        missing = [c for c in added if c.split()[0] not in columns]
+        if missing:
+            for column in missing:
+                self._db.execute(f"ALTER TABLE docs ADD COLUMN {column}")
+            self._db.execute("DELETE FROM state WHERE key IN ('last_id', 'last_ts', 'cursor_ts', 'cursor_id')")
+        # Files from before the (timestamp, id) cursor: resume at the start of
+        # the old max timestamp, so rows sharing it are re-read, not skipped
+        last_ts = self._get_state("last_ts")
+        if last_ts is not None:
+            if self._get_state("cursor_ts") is None:
+                self._set_state("cursor_ts", last_ts)
+                self._set_state("cursor_id", 0)
+            self._db.execute("DELETE FROM state WHERE key = 'last_ts'")
+        # abnormal rows of a patient, for the RAG pre-pass
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_docs_abnormal ON docs (abnormal, name COLLATE NOCASE, timestamp)"
+        )
+        self._db.commit()
+
+    # ── persistence ──
+    def _get_state(self, key, default=None):
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    @traced("index.load")
+    def _load(self):
+        dim = self._get_state("dim")
+        if dim is None:
+            dim = len(self.embeddings.embed_query("dimension probe"))
+            self._set_state("dim", dim)
+            self._db.commit()
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(int(dim)))
+
+        rows = self._db.execute("SELECT id, vector FROM docs").fetchall()
+        if rows:
+            ids = np.array([r[0] for r in rows], dtype="int64")
+            vectors = np.frombuffer(b"".join(r[1] for r in rows), dtype="float32")
+            index.add_with_ids(vectors.reshape(len(rows), -1), ids)
+        return index
+
+    def __len__(self):
+        with self._lock:
+            return self._index.ntotal
+
+    # ── updates ──
+    # Out-of-range detection runs here, once per row, so an analysis only
+    # reads the rows already marked abnormal
+    def upsert(self, rows):
+        if not rows:
+            return 0
+        texts = [report_text(r) for r in rows]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype="float32")
+        ids = np.array([r["id"] for r in rows], dtype="int64")
+        detected = abnormal.detect(pd.DataFrame(rows)[["result", "ref_range", "flag"]])
+        detected = detected.astype(object).where(detected.notna(), None)
+
+        with span("index.add", rows=len(rows)), self._lock:
+            self._index.remove_ids(faiss.IDSelectorBatch(ids))
+            self._index.add_with_ids(vectors, ids)
+            self._db.executemany(
+                """
+                INSERT OR REPLACE INTO docs
+                (id, name, test_name, flag, timestamp, result, unit, ref_range,
+                 low, high, status, abnormal, text, vector)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (int(r["id"]), r["name"], r["test_name"], r["flag"],
+                     str(r.get("timestamp")), _float(r.get("result")), r.get("unit"),
+                     r.get("ref_range"), d["low"], d["high"], d["status"], int(d["abnormal"]),
+                     text, vec.tobytes())
+                    for r, d, text, vec in zip(rows, detected.to_dict("records"), texts, vectors)
+                ],
+            )
+            self._db.commit()
+        return len(rows)
+
+    # Watermarks are only moved by sync(), past rows it has upserted
+    def _save_watermark(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._set_state(key, value)
+            self._db.commit()
+
+    def remove_ids(self, ids):
+        ids = np.array(list(ids), dtype="int64")
+        if not len(ids):
+            return
+        with self._lock:
+            self._index.remove_ids(faiss.IDSelectorBatch(ids))
+            self._db.executemany("DELETE FROM docs WHERE id = ?", [(int(i),) for i in ids])
+            self._db.commit()
+
+    def upsert_ids(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(ids))
+        rows = records.fetch_reports(f"WHERE r.id IN ({placeholders})", ids)
+        self.remove_ids(set(ids) - {r["id"] for r in rows})
+        return self.upsert(rows)
+
+    # Catch up on rows added since the last sync. Two watermarks: the
+    # (timestamp, id) cursor of the last row read in timestamp order, and
+    # `last_id` for rows inserted later with older stamps. They are read
+    # under the sync lock, so concurrent syncs don't embed the same delta
+    # twice. The catch-up is paged and the cursor is saved after each page,
+    # so a first sync of a large table doesn't load it all at once, and an
+    # interrupted one resumes at the exact row where it stopped.
+    #
+    # Ids don't become visible in id order, so a row can commit behind both
+    # watermarks. The older-stamp scan therefore starts `lag` ids below
+    # `last_id`, reads only ids, and embeds the ones the index lacks.
+    @traced("index.sync")
+    def sync(self, batch_size=SYNC_BATCH_SIZE, lag=SYNC_ID_LAG):
+        with self._sync_lock:
+            with self._lock:
+                last_id = int(self._get_state("last_id", 0))
+                cursor_ts = self._get_state("cursor_ts", "1970-01-01 00:00:00")
+                cursor_id = int(self._get_state("cursor_id", 0))
+            max_id = last_id
+
+            # Rows after the cursor, in (timestamp, id) order
+            total = 0
+            ts, after_id = cursor_ts, cursor_id
+            while True:
+                rows = records.fetch_reports(
+                    "WHERE r.timestamp > %s OR (r.timestamp = %s AND r.id > %s)"
+                    " ORDER BY r.timestamp, r.id LIMIT %s",
+                    (ts, ts, after_id, batch_size),
+                )
+                total += self.upsert(rows)
+                if rows:
+                    ts, after_id = str(rows[-1]["timestamp"]), rows[-1]["id"]
+                    max_id = max(max_id, *(r["id"] for r in rows))
+                    self._save_watermark(cursor_ts=ts, cursor_id=after_id)
+                if len(rows) < batch_size:
+                    break
+
+            # New rows at or before the old cursor (backdated or imported
+            # results), plus late commits in the lag window
+            after_id = max(0, last_id - lag)
+            page_size = batch_size * 10  # ids are cheap; rows are embedded batch_size at a time
+            while True:
+                ids = records.report_ids(
+                    "WHERE r.id > %s AND (r.timestamp < %s OR (r.timestamp = %s AND r.id <= %s))"
+                    " ORDER BY r.id LIMIT %s",
+                    (after_id, cursor_ts, cursor_ts, cursor_id, page_size),
+                )
+                missing = sorted(set(ids) - self._existing(ids))
+                for start in range(0, len(missing), batch_size):
+                    total += self.upsert_ids(missing[start:start + batch_size])
+                if ids:
+                    after_id = ids[-1]
+                    max_id = max(max_id, after_id)
+                    self._save_watermark(last_id=max(last_id, after_id))
+                if len(ids) < page_size:
+                    break
+
+            # Rows up to max_id that commit later are found through the lag window
+            self._save_watermark(last_id=max_id)
+            return total
+
+    # ── metadata pre-filters ──
+    # filters: name, start (inclusive), end (exclusive), test_name, flag,
+    # abnormal (only rows detected as out of range or flagged)
+    def _where(self, filters):
+        clauses, params = [], []
+        if filters.get("abnormal"):
+            clauses.append("abnormal = 1")
+        for field in ("name", "test_name", "flag"):
+            if filters.get(field):
+                clauses.append(f"{field} = ? COLLATE NOCASE")
+                params.append(str(filters[field]).strip())
+        if filters.get("start"):
+            clauses.append("timestamp >= ?")
+            params.append(str(filters["start"]))
+        if filters.get("end"):
+            clauses.append("timestamp < ?")
+            params.append(str(filters["end"]))
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def filter_ids(self, filters):
+        where, params = self._where(filters)
+        with self._lock:
+            return [r[0] for r in self._db.execute(f"SELECT id FROM docs {where}", params)]
+
+    # Structured columns of the given rows, in the order of `ids`
+    def rows(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT id, name, test_name, result, unit, ref_range, flag, timestamp, status"
+                f" FROM docs WHERE id IN ({placeholders})",
+                ids,
+            )
+            columns = [c[0] for c in cursor.description]
+            found = {r[0]: dict(zip(columns, r)) for r in cursor}
+        return [found[i] for i in ids if i in found]
+
+    # Per-test summary of the filtered rows (the columns abnormal.summarize
+    # produces), aggregated by SQLite from the stored status
+    @traced("index.test_summary")
+    def test_summary(self, filters=None):
+        where, params = self._where(filters or {})
+        with self._lock:
+            return pd.read_sql_query(
+                f"""
+                WITH scoped AS (SELECT * FROM docs {where}),
+                latest AS (
+                    SELECT test_name, unit, ref_range, result, status, timestamp,
+                           ROW_NUMBER() OVER (PARTITION BY test_name ORDER BY timestamp DESC, id DESC) AS rn
+                    FROM scoped
+                )
+                SELECT s.test_name, l.unit, l.ref_range,
+                       COUNT(*) AS results,
+                       SUM(s.abnormal) AS abnormal,
+                       SUM(s.status = 'High') AS high,
+                       SUM(s.status = 'Low') AS low,
+                       MIN(s.result) AS min,
+                       MAX(s.result) AS max,
+                       l.result AS latest,
+                       l.status AS latest_status,
+                       l.timestamp AS latest_date
+                FROM scoped s
+                JOIN latest l ON l.test_name = s.test_name AND l.rn = 1
+                GROUP BY s.test_name
+                ORDER BY s.test_name
+                """,
+                self._db,
+                params=params,
+            )
+
+    def count(self, filters=None, ids=None):
+        return len(self._scope(filters, ids)) if (filters or ids is not None) else len(self)
+
+    # Candidate ids (None = everything); only ids present in the index
+    def _scope(self, filters, ids):
+        scope = None if ids is None else self._existing(ids)
+        if filters:
+            matched = set(self.filter_ids(filters))
+            scope = matched if scope is None else scope & matched
+        return scope
+
+    def _existing(self, ids):
+        ids = [int(i) for i in ids]
+        found = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                found.update(
+                    r[0] for r in self._db.execute(f"SELECT id FROM docs WHERE id IN ({placeholders})", chunk)
+                )
+        return found
+
+    # ── search ──
+    def _search_subset(self, vector, ids, k):
+        vectors = self._index.reconstruct_batch(ids)
+        scores = vectors @ vector[0]
+        top = np.argsort(-scores)[:k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _search_selector(self, vector, ids, k):
+        params = None
+        if ids is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+        scores, found = self._index.search(vector, k, params=params)
+        return [(int(i), float(s)) for i, s in zip(found[0], scores[0]) if i != -1]
+
+    # Structured filters narrow the candidate ids first, so cost follows
+    # the filtered subset rather than the whole table
+    def similarity_search(self, query, k=5, ids=None, filters=None):
+        vector = np.asarray([self.embeddings.embed_query(query)], dtype="float32")
+
+        with span("index.search", k=k) as attrs, self._lock:
+            scope = self._scope(filters, ids)
+            attrs["candidates"] = "all" if scope is None else len(scope)
+            if scope is not None and not scope:
+                return []
+            if scope is None:
+                k = min(k, self._index.ntotal)
+                hits = self._search_selector(vector, None, k) if k else []
+            else:
+                subset = np.array(sorted(scope), dtype="int64")
+                k = min(k, len(subset))
+                if len(subset) <= DIRECT_SEARCH_MAX:
+                    hits = self._search_subset(vector, subset, k)
+                else:
+                    hits = self._search_selector(vector, subset, k)
+            if not hits:
+                return []
+            placeholders = ", ".join("?" * len(hits))
+            texts = dict(
+                self._db.execute(
+                    f"SELECT id, text FROM docs WHERE id IN ({placeholders})",
+                    [i for i, _ in hits],
+                ).fetchall()
+            )
+
+        return [
+            Document(page_content=texts[i], metadata={"id": i, "score": s})
+            for i, s in hits
+            if i in texts
+        ]
+
+    def as_retriever(self, k=5, ids=None, filters=None):
+        return ReportRetriever(index=self, k=k, ids=ids, filters=filters)
+
+
+class ReportRetriever(BaseRetriever):
+    index: Any
+    k: int = 5
+    ids: Optional[List[int]] = None
+    filters: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.index.similarity_search(query, k=self.k, ids=self.ids, filters=self.filters)
+
+
+# Loaded once per server process. Not synced here: callers catch it up
+# themselves, under jobs.EMBEDDING_LOCK where the process runs jobs
+@st.cache_resource
+def get_report_index():
+    embeddings = get_embeddings(EMBED_MODEL)
+    path = os.path.join(INDEX_DIR, EMBED_MODEL.replace("/", "__") + ".sqlite")
+    return ReportIndex(path, embeddings)